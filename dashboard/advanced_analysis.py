@@ -1,15 +1,226 @@
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from sklearn.cluster import KMeans
 from sklearn.decomposition import PCA
-from sklearn.preprocessing import StandardScaler
+from joblib import Parallel, delayed
+from scipy.stats import skew, kurtosis, shapiro, normaltest, probplot, kruskal
+from statsmodels.tsa.seasonal import STL
+from statsmodels.tsa.stattools import acf, pacf
 import streamlit as st
 
+
+def _hash_dataframe(df):
+    """
+    st.cache_data用のデータフレームのハッシュ関数
+    
+    Streamlitのデフォルトのハッシュ（pickle経由）より高速に、
+    形状・列名・内容からキーを生成する
+    """
+    return (
+        df.shape,
+        tuple(df.columns),
+        pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    )
+
+
+def _fill_forward_backward(series):
+    """
+    欠損値を前方補完し、先頭に残った欠損値を後方補完する関数
+    
+    fillna(method='ffill').fillna(method='bfill')と同じ結果を、
+    中間のSeriesを作らずにNumPy配列上で計算する
+    
+    Parameters:
+    -----------
+    series : pandas.Series
+        補完する系列
+        
+    Returns:
+    --------
+    pandas.Series
+        補完後の系列（元の系列は変更しない）
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    valid = ~np.isnan(values)
+    
+    if valid.any() and not valid.all():
+        # 直前の有効値の位置を累積最大で求めて前方補完
+        idx = np.where(valid, np.arange(values.size), 0)
+        np.maximum.accumulate(idx, out=idx)
+        values = values[idx]
+        
+        # 先頭に残った欠損値は最初の有効値で埋める（後方補完）
+        first_valid = np.argmax(valid)
+        values[:first_valid] = values[first_valid]
+    
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def _rolling_means(series, windows):
+    """
+    複数の窓幅の移動平均をまとめて計算する関数
+    
+    累積和を1回だけ計算し、各窓幅の移動平均をその差分から求める。
+    窓内に欠損値がある位置はrolling(window).mean()と同様にNaNとなる
+    
+    Parameters:
+    -----------
+    series : pandas.Series
+        移動平均を計算する系列
+    windows : list
+        窓幅のリスト
+        
+    Returns:
+    --------
+    dict
+        窓幅をキー、移動平均の配列を値とする辞書
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    
+    # 先頭に0を付けた累積和（値と欠損数）
+    value_sums = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+    missing_counts = np.concatenate(([0], np.cumsum(missing)))
+    
+    results = {}
+    for window in windows:
+        means = np.full(values.size, np.nan)
+        window_sums = value_sums[window:] - value_sums[:-window]
+        window_missing = missing_counts[window:] - missing_counts[:-window]
+        means[window - 1:] = np.where(window_missing == 0, window_sums / window, np.nan)
+        results[window] = means
+    
+    return results
+
+
+def _correlogram_figure(values, confint, title):
+    """
+    自己相関・偏自己相関の棒グラフ（95%信頼区間付き）を作成する関数
+    
+    Parameters:
+    -----------
+    values : numpy.ndarray
+        ラグ0からの（偏）自己相関係数
+    confint : numpy.ndarray
+        各ラグの信頼区間（形状は (ラグ数, 2)）
+    title : str
+        グラフのタイトル
+        
+    Returns:
+    --------
+    plotly.graph_objects.Figure
+        コレログラム
+    """
+    lags = np.arange(len(values))
+    # statsmodelsのプロットと同様に、信頼区間は0を中心に表示する
+    lower = confint[:, 0] - values
+    upper = confint[:, 1] - values
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=lags, y=upper, mode='lines', line=dict(width=0),
+                             showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=lags, y=lower, mode='lines', line=dict(width=0),
+                             fill='tonexty', fillcolor='rgba(31, 119, 180, 0.2)',
+                             name='95%信頼区間', hoverinfo='skip'))
+    fig.add_trace(go.Bar(x=lags, y=values, name='相関係数', width=0.3))
+    fig.update_layout(title=title, xaxis_title='ラグ', yaxis_title='相関係数', showlegend=False)
+    
+    return fig
+
+
+def _decompose_time_series(time_series_df, time_series_filled, value_column, x_values, scatter_trace):
+    """
+    時系列をトレンド・季節性・残差に分解し、プロットを作成する関数
+    
+    Returns:
+    --------
+    dict
+        分解結果とプロット（失敗した場合はエラーメッセージ）
+    """
+    results = {}
+    
+    try:
+        # 頻度を推定
+        if time_series_df.index.freq is None or 'D' in time_series_df.index.freqstr:
+            period = 7  # 週次の季節性を仮定（日次データと仮定）
+        else:
+            period = 12  # 月次の季節性を仮定（月次データの場合）
+        
+        # インデックスが日付型であることを確認
+        if pd.api.types.is_datetime64_any_dtype(time_series_df.index):
+            # 季節分解を実行（STL、float32で計算）
+            decomposition = STL(time_series_filled.astype('float32'), period=period).fit()
+            
+            # 結果を辞書に格納
+            results['trend'] = decomposition.trend
+            results['seasonal'] = decomposition.seasonal
+            results['residual'] = decomposition.resid
+            
+            # 季節分解のプロット
+            fig = make_subplots(rows=4, cols=1, 
+                               subplot_titles=['Observed', 'Trend', 'Seasonal', 'Residual'])
+            
+            fig.add_trace(scatter_trace(x=x_values, y=time_series_df[value_column].to_numpy(), 
+                                       name='Observed'), row=1, col=1)
+            
+            fig.add_trace(scatter_trace(x=x_values, y=decomposition.trend.to_numpy(), 
+                                       name='Trend'), row=2, col=1)
+            
+            fig.add_trace(scatter_trace(x=x_values, y=decomposition.seasonal.to_numpy(), 
+                                       name='Seasonal'), row=3, col=1)
+            
+            fig.add_trace(scatter_trace(x=x_values, y=decomposition.resid.to_numpy(), 
+                                       name='Residual'), row=4, col=1)
+            
+            fig.update_layout(height=800, title_text=f"{value_column}の時系列分解")
+            
+            results['decomposition_plot'] = fig
+    except Exception as e:
+        results['error'] = f"時系列分解中にエラーが発生しました: {e}"
+    
+    return results
+
+
+def _autocorrelation_plots(time_series_filled, value_column):
+    """
+    自己相関・偏自己相関を計算し、コレログラムを作成する関数
+    
+    Returns:
+    --------
+    dict
+        コレログラム（失敗した場合はエラーメッセージ）
+    """
+    results = {}
+    
+    try:
+        values = time_series_filled.to_numpy()
+        
+        # 自己相関（FFTで計算）
+        acf_lags = min(30, len(values) // 2)
+        acf_values, acf_confint = acf(values, nlags=acf_lags, fft=True, alpha=0.05)
+        results['acf_plot'] = _correlogram_figure(
+            acf_values, acf_confint, f"{value_column}の自己相関関数"
+        )
+        
+        # 偏自己相関（標本サイズの50%未満のラグまで計算可能）
+        pacf_lags = min(30, len(values) // 2 - 1)
+        pacf_values, pacf_confint = pacf(values, nlags=pacf_lags, method='ywm', alpha=0.05)
+        results['pacf_plot'] = _correlogram_figure(
+            pacf_values, pacf_confint, f"{value_column}の偏自己相関関数"
+        )
+    except Exception as e:
+        results['error'] = f"自己相関分析中にエラーが発生しました: {e}"
+    
+    return results
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
 def perform_time_series_analysis(df, date_column, value_column):
     """
     時系列データの分析を行う関数
@@ -29,124 +240,109 @@ def perform_time_series_analysis(df, date_column, value_column):
         分析結果と可視化用のグラフオブジェクト
     """
     # 日付でソート
-    df = df.sort_values(by=date_column)
+    df = df.sort_values(by=date_column, kind='stable', ignore_index=True)
     
-    # 日付列をインデックスに設定
-    time_series_df = df.set_index(date_column)[[value_column]].copy()
+    # 日付列をインデックスとした値の列だけのデータフレームを直接作成
+    time_series_df = pd.DataFrame(
+        {value_column: df[value_column].to_numpy()},
+        index=pd.DatetimeIndex(df[date_column].to_numpy(), name=date_column)
+    )
     
     # 結果を格納する辞書
     results = {}
     
     # 移動平均の計算
     windows = [7, 14, 30]
-    for window in windows:
-        if len(time_series_df) > window:
-            time_series_df[f'{value_column}_MA{window}'] = time_series_df[value_column].rolling(window=window).mean()
+    moving_averages = _rolling_means(
+        time_series_df[value_column],
+        [window for window in windows if len(time_series_df) > window]
+    )
+    for window, ma_values in moving_averages.items():
+        time_series_df[f'{value_column}_MA{window}'] = ma_values
+    
+    # プロット用のNumPy配列（長い系列はWebGLで描画）
+    x_values = time_series_df.index.to_numpy()
+    scatter_trace = go.Scattergl if len(x_values) > 5000 else go.Scatter
+    
+    # 欠損値の処理（季節分解と自己相関分析で共有）
+    time_series_filled = _fill_forward_backward(time_series_df[value_column])
+    
+    # 季節分解・自己相関分析・時系列プロットは互いに独立なので並行して実行
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = []
+        
+        # トレンドと季節性の分析
+        if len(time_series_df) >= 30:  # 十分なデータがある場合
+            futures.append(executor.submit(
+                _decompose_time_series, time_series_df, time_series_filled,
+                value_column, x_values, scatter_trace
+            ))
+        
+        # 自己相関分析
+        futures.append(executor.submit(_autocorrelation_plots, time_series_filled, value_column))
+        
+        # 基本的な時系列プロット
+        fig = px.line(df, x=date_column, y=value_column, title=f"{value_column}の時系列データ")
+        
+        # 移動平均線を追加
+        for window in windows:
+            ma_col = f'{value_column}_MA{window}'
+            if ma_col in time_series_df.columns:
+                fig.add_trace(
+                    scatter_trace(
+                        x=x_values,
+                        y=time_series_df[ma_col].to_numpy(),
+                        mode='lines',
+                        name=f'{window}日移動平均'
+                    )
+                )
+        
+        # 季節分解→自己相関の順に結果を反映（エラーは後のものが優先）
+        for future in futures:
+            results.update(future.result())
     
-    # トレンドと季節性の分析
-    if len(time_series_df) >= 30:  # 十分なデータがある場合
-        try:
-            from statsmodels.tsa.seasonal import seasonal_decompose
-            
-            # 頻度を推定
-            if 'D' in time_series_df.index.freq or time_series_df.index.freq is None:
-                freq = 'D'  # 日次データと仮定
-                period = 7  # 週次の季節性を仮定
-            else:
-                freq = time_series_df.index.freq
-                period = 12  # 月次の季節性を仮定（月次データの場合）
-            
-            # インデックスが日付型であることを確認
-            if pd.api.types.is_datetime64_any_dtype(time_series_df.index):
-                # データの欠損値を線形補間で埋める
-                time_series_df_filled = time_series_df[[value_column]].fillna(method='ffill').fillna(method='bfill')
-                
-                # 季節分解を実行
-                decomposition = seasonal_decompose(time_series_df_filled, model='additive', period=period)
-                
-                # 結果を辞書に格納
-                results['trend'] = decomposition.trend
-                results['seasonal'] = decomposition.seasonal
-                results['residual'] = decomposition.resid
-                
-                # 季節分解のプロット
-                fig = make_subplots(rows=4, cols=1, 
-                                   subplot_titles=['Observed', 'Trend', 'Seasonal', 'Residual'])
-                
-                fig.add_trace(go.Scatter(x=time_series_df.index, y=time_series_df[value_column], 
-                                        name='Observed'), row=1, col=1)
-                
-                fig.add_trace(go.Scatter(x=decomposition.trend.index, y=decomposition.trend, 
-                                        name='Trend'), row=2, col=1)
-                
-                fig.add_trace(go.Scatter(x=decomposition.seasonal.index, y=decomposition.seasonal, 
-                                        name='Seasonal'), row=3, col=1)
-                
-                fig.add_trace(go.Scatter(x=decomposition.resid.index, y=decomposition.resid, 
-                                        name='Residual'), row=4, col=1)
-                
-                fig.update_layout(height=800, title_text=f"{value_column}の時系列分解")
-                
-                results['decomposition_plot'] = fig
-        except Exception as e:
-            results['error'] = f"時系列分解中にエラーが発生しました: {e}"
+    results['time_series_plot'] = fig
     
-    # 自己相関分析
-    try:
-        from statsmodels.graphics.tsaplots import plot_acf, plot_pacf
-        import io
-        from PIL import Image
-        
-        # 欠損値の処理
-        ts_data = time_series_df[value_column].fillna(method='ffill').fillna(method='bfill')
-        
-        # 自己相関プロット
-        acf_buf = io.BytesIO()
-        fig_acf, ax = plt.subplots(figsize=(10, 4))
-        plot_acf(ts_data, ax=ax, lags=min(30, len(ts_data) // 2))
-        ax.set_title(f"{value_column}の自己相関関数")
-        plt.tight_layout()
-        fig_acf.savefig(acf_buf, format='png')
-        plt.close(fig_acf)
-        
-        # 偏自己相関プロット
-        pacf_buf = io.BytesIO()
-        fig_pacf, ax = plt.subplots(figsize=(10, 4))
-        plot_pacf(ts_data, ax=ax, lags=min(30, len(ts_data) // 2))
-        ax.set_title(f"{value_column}の偏自己相関関数")
-        plt.tight_layout()
-        fig_pacf.savefig(pacf_buf, format='png')
-        plt.close(fig_pacf)
-        
-        # 結果に保存
-        acf_buf.seek(0)
-        pacf_buf.seek(0)
-        results['acf_plot'] = acf_buf
-        results['pacf_plot'] = pacf_buf
-    except Exception as e:
-        results['error'] = f"自己相関分析中にエラーが発生しました: {e}"
+    return results
+
+
+def compute_correlation_matrix(numeric_df):
+    """
+    相関係数行列を計算する関数
     
-    # 基本的な時系列プロット
-    fig = px.line(df, x=date_column, y=value_column, title=f"{value_column}の時系列データ")
+    欠損値がない場合はfloat32の連続配列に変換し、標準化した列同士の
+    行列積（BLAS）で計算する。欠損値がある場合はpandasのペアワイズ計算を使う
     
-    # 移動平均線を追加
-    for window in windows:
-        ma_col = f'{value_column}_MA{window}'
-        if ma_col in time_series_df.columns:
-            fig.add_trace(
-                go.Scatter(
-                    x=time_series_df.index,
-                    y=time_series_df[ma_col],
-                    mode='lines',
-                    name=f'{window}日移動平均'
-                )
-            )
+    Parameters:
+    -----------
+    numeric_df : pandas.DataFrame
+        数値列のみのデータフレーム
+        
+    Returns:
+    --------
+    pandas.DataFrame
+        相関係数行列
+    """
+    values = np.ascontiguousarray(numeric_df.to_numpy(dtype=np.float32, na_value=np.nan, copy=True))
     
-    results['time_series_plot'] = fig
+    if values.shape[0] < 2 or np.isnan(values).any():
+        return numeric_df.corr()
     
-    return results
+    # 各列を平均0・標準偏差1に標準化
+    values -= values.mean(axis=0)
+    std = values.std(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values /= std
+    
+    corr = (values.T @ values) / values.shape[0]
+    np.clip(corr, -1.0, 1.0, out=corr)
+    # 定数列の相関はpandasと同様にNaNとする
+    corr[np.diag_indices_from(corr)] = np.where(std > 0, 1.0, np.nan)
+    
+    return pd.DataFrame(corr.astype(np.float64), index=numeric_df.columns, columns=numeric_df.columns)
 
 
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
 def perform_correlation_analysis(df, numeric_columns):
     """
     相関分析を行う関数
@@ -166,63 +362,115 @@ def perform_correlation_analysis(df, numeric_columns):
     # 結果を格納する辞書
     results = {}
     
-    # 数値列のみを抽出
-    numeric_df = df[numeric_columns].copy()
+    # 数値列のみを抽出（列選択で新しいフレームになるためコピーは不要）
+    numeric_df = df[numeric_columns]
     
     # 相関係数行列の計算
-    corr_matrix = numeric_df.corr()
+    corr_matrix = compute_correlation_matrix(numeric_df)
     results['correlation_matrix'] = corr_matrix
     
-    # ヒートマップの生成
+    # ヒートマップの生成（セルのラベルはNumPyでまとめて書式化）
+    labels = np.char.mod('%.2f', corr_matrix.to_numpy())
     fig = px.imshow(
         corr_matrix,
-        text_auto=True,
+        zmin=-1,
+        zmax=1,
         aspect="auto",
         color_continuous_scale='RdBu_r',
         title="相関係数ヒートマップ"
     )
+    fig.update_traces(text=labels, texttemplate='%{text}')
     results['heatmap'] = fig
     
     # 強い相関を持つ変数ペアの特定
-    strong_correlations = []
-    
-    for i in range(len(corr_matrix.columns)):
-        for j in range(i+1, len(corr_matrix.columns)):
-            col1 = corr_matrix.columns[i]
-            col2 = corr_matrix.columns[j]
-            corr_value = corr_matrix.iloc[i, j]
-            
-            if abs(corr_value) > 0.5:  # 相関係数の絶対値が0.5より大きいペアを抽出
-                strong_correlations.append({
-                    'variable1': col1,
-                    'variable2': col2,
-                    'correlation': corr_value
-                })
-    
+    # 上三角部分（対角を除く）をまとめて取り出す
+    corr_values = corr_matrix.to_numpy()
+    iu, ju = np.triu_indices(corr_values.shape[0], k=1)
+    pair_values = corr_values[iu, ju]
+    mask = np.abs(pair_values) > 0.5  # 相関係数の絶対値が0.5より大きいペアを抽出
+
+    pairs = list(zip(corr_matrix.columns[iu[mask]], corr_matrix.columns[ju[mask]], pair_values[mask]))
+
     # 強い相関を持つペアを相関係数の絶対値でソート
-    strong_correlations = sorted(strong_correlations, key=lambda x: abs(x['correlation']), reverse=True)
+    pairs.sort(key=lambda x: -abs(x[2]))
+    strong_correlations = [
+        {'variable1': col1, 'variable2': col2, 'correlation': corr_value}
+        for col1, col2, corr_value in pairs
+    ]
     results['strong_correlations'] = strong_correlations
     
-    # 強い相関を持つ上位のペアの散布図
-    scatter_plots = []
+    # 強い相関を持つ上位のペアの散布図（ペアごとに独立なので並行して作成）
+    top_pairs = strong_correlations[:min(5, len(strong_correlations))]
     
-    for i, corr_pair in enumerate(strong_correlations[:min(5, len(strong_correlations))]):
+    def make_scatter(corr_pair):
         col1 = corr_pair['variable1']
         col2 = corr_pair['variable2']
         corr = corr_pair['correlation']
         
-        fig = px.scatter(
-            df, x=col1, y=col2, 
+        # 表示用途なのでfloat32で十分（転送量を半分にする）
+        plot_df = pd.DataFrame({
+            col1: df[col1].to_numpy(dtype=np.float32, na_value=np.nan),
+            col2: df[col2].to_numpy(dtype=np.float32, na_value=np.nan)
+        })
+        
+        return px.scatter(
+            plot_df, x=col1, y=col2, 
             trendline="ols",
             title=f"{col1} vs {col2} (相関係数: {corr:.3f})"
         )
-        scatter_plots.append(fig)
+    
+    if top_pairs:
+        with ThreadPoolExecutor(max_workers=min(8, len(top_pairs))) as executor:
+            scatter_plots = list(executor.map(make_scatter, top_pairs))
+    else:
+        scatter_plots = []
     
     results['scatter_plots'] = scatter_plots
     
     return results
 
 
+@st.cache_resource(show_spinner=False)
+def _fit_kmeans(scaled_data, n_clusters):
+    """
+    KMeansモデルを学習する（再実行間で学習済みモデルを共有）
+    """
+    kmeans = KMeans(n_clusters=n_clusters, n_init='auto', algorithm='elkan', random_state=42)
+    kmeans.fit(scaled_data)
+    return kmeans
+
+
+@st.cache_resource(show_spinner=False)
+def _fit_pca(scaled_data):
+    """
+    2次元のPCAモデルを学習する（再実行間で学習済みモデルを共有）
+    
+    列数が多い場合は2成分だけを求める乱択SVDを使い、
+    少ない場合は精度を優先して通常の解法を使う
+    """
+    if scaled_data.shape[1] > 50:
+        pca = PCA(n_components=2, svd_solver='randomized', random_state=42)
+    else:
+        pca = PCA(n_components=2, svd_solver='auto')
+    pca.fit(scaled_data)
+    return pca
+
+
+def _kruskal_column(column_values, idx_by_cluster):
+    """
+    1列分のKruskal-Wallis検定を行う（検定できない場合はNoneを返す）
+    """
+    groups = [column_values[idx] for idx in idx_by_cluster]
+    groups = [g[np.isfinite(g)] for g in groups]
+    
+    try:
+        return kruskal(*groups)
+    except ValueError:
+        # 全ての値が同一の場合など
+        return None
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
 def perform_cluster_analysis(df, numeric_columns, n_clusters=3):
     """
     クラスター分析を行う関数
@@ -244,19 +492,29 @@ def perform_cluster_analysis(df, numeric_columns, n_clusters=3):
     # 結果を格納する辞書
     results = {}
     
-    # 数値列のみを抽出
-    numeric_df = df[numeric_columns].copy()
+    # 数値列のみをC連続のNumPy配列として抽出
+    values = np.ascontiguousarray(df[numeric_columns].to_numpy(dtype=np.float64, na_value=np.nan))
     
-    # 欠損値の処理
-    numeric_df = numeric_df.fillna(numeric_df.mean())
+    # 欠損値の処理（列ごとの平均値で補完）
+    filled_values = np.where(np.isnan(values), np.nanmean(values, axis=0), values)
     
-    # スケーリング
-    scaler = StandardScaler()
-    scaled_data = scaler.fit_transform(numeric_df)
+    # スケーリング（標準化。分散0の列は0のままにする）
+    mean = filled_values.mean(axis=0)
+    std = filled_values.std(axis=0, ddof=0)
+    std[std == 0] = 1.0
+    # 補完済みの配列（np.whereで新しく確保済み）をその場で標準化し、
+    # 一時配列を作らずにfloat32のC連続配列として学習に渡す
+    filled_values -= mean
+    filled_values /= std
+    scaled_data = np.ascontiguousarray(filled_values, dtype=np.float32)
     
     # KMeansクラスタリングの実行
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
-    clusters = kmeans.fit_predict(scaled_data)
+    kmeans = _fit_kmeans(scaled_data, n_clusters)
+    clusters = kmeans.labels_
+    
+    # クラスターごとの行インデックス（以降の集計・検定で共有。groupbyと同じく行のないクラスターは含めない）
+    present_clusters = np.unique(clusters)
+    idx_by_cluster = [np.flatnonzero(clusters == c) for c in present_clusters]
     
     # クラスターラベルをデータフレームに追加
     df_with_clusters = df.copy()
@@ -264,14 +522,30 @@ def perform_cluster_analysis(df, numeric_columns, n_clusters=3):
     
     results['df_with_clusters'] = df_with_clusters
     
-    # クラスターごとの基本統計量
-    cluster_stats = df_with_clusters.groupby('cluster')[numeric_columns].agg(['mean', 'std', 'min', 'max'])
+    # クラスターごとの基本統計量（欠損値を除いて集計）
+    stat_names = ['mean', 'std', 'min', 'max']
+    stats = np.empty((len(present_clusters), len(numeric_columns), len(stat_names)))
+    with warnings.catch_warnings():
+        # 全て欠損のグループはNaNとする（groupbyと同じ結果）
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for c, idx in enumerate(idx_by_cluster):
+            sub = values[idx]
+            stats[c, :, 0] = np.nanmean(sub, axis=0)
+            stats[c, :, 1] = np.nanstd(sub, axis=0, ddof=1)
+            stats[c, :, 2] = np.nanmin(sub, axis=0)
+            stats[c, :, 3] = np.nanmax(sub, axis=0)
+    
+    cluster_stats = pd.DataFrame(
+        stats.reshape(len(present_clusters), -1),
+        index=pd.Index(present_clusters, name='cluster'),
+        columns=pd.MultiIndex.from_product([numeric_columns, stat_names])
+    )
     results['cluster_stats'] = cluster_stats
     
     # 次元削減（PCA）
     if len(numeric_columns) > 2:
-        pca = PCA(n_components=2)
-        pca_result = pca.fit_transform(scaled_data)
+        pca = _fit_pca(scaled_data)
+        pca_result = pca.transform(scaled_data)
         
         pca_df = pd.DataFrame({
             'PC1': pca_result[:, 0],
@@ -301,31 +575,36 @@ def perform_cluster_analysis(df, numeric_columns, n_clusters=3):
         results['pca_loadings'] = loadings
         
         # 変数寄与度の可視化
-        fig_loadings = px.bar(
-            loadings.reset_index(),
-            x='index', y=['PC1', 'PC2'],
+        fig_loadings = go.Figure([
+            go.Bar(name='PC1', x=numeric_columns, y=pca.components_[0]),
+            go.Bar(name='PC2', x=numeric_columns, y=pca.components_[1])
+        ])
+        fig_loadings.update_layout(
             barmode='group',
             title="各変数の主成分への寄与度",
-            labels={'index': '変数', 'value': '寄与度'}
+            xaxis_title='変数',
+            yaxis_title='寄与度'
         )
         results['loadings_plot'] = fig_loadings
     
     # クラスター別の箱ひげ図（最も特徴的な変数を選択）
     if len(numeric_columns) > 0:
         # Kruskal-Wallis検定でクラスター間で最も差がある変数を特定
-        from scipy.stats import kruskal
+        # 各グループに十分なデータがある列だけを検定対象にする
+        finite = np.isfinite(values)
+        sizes = np.array([finite[idx].sum(axis=0) for idx in idx_by_cluster])
+        testable = np.flatnonzero(sizes.min(axis=0) > 5)
+        
+        # 列ごとの検定は互いに独立なのでスレッドで並列実行
+        outputs = Parallel(n_jobs=-1, prefer='threads')(
+            delayed(_kruskal_column)(values[:, j], idx_by_cluster) for j in testable
+        )
         
         kruskal_results = {}
-        for col in numeric_columns:
-            try:
-                groups = [df_with_clusters[df_with_clusters['cluster'] == c][col].dropna() for c in range(n_clusters)]
-                
-                # 各グループに十分なデータがあるか確認
-                if all(len(g) > 5 for g in groups):
-                    stat, p = kruskal(*groups)
-                    kruskal_results[col] = {'statistic': stat, 'p-value': p}
-            except:
-                continue
+        for j, output in zip(testable, outputs):
+            if output is not None:
+                stat, p = output
+                kruskal_results[numeric_columns[j]] = {'statistic': stat, 'p-value': p}
         
         if kruskal_results:
             # p値でソート
@@ -351,6 +630,68 @@ def perform_cluster_analysis(df, numeric_columns, n_clusters=3):
     return results
 
 
+# ヒストグラムのビン数の上限と、カテゴリ変数の棒グラフに表示する最大カテゴリ数
+MAX_HISTOGRAM_BINS = 200
+MAX_BAR_CATEGORIES = 30
+
+
+def _binned_histogram_figure(values, column):
+    """
+    NumPyで集計したビンの度数から、確率密度のヒストグラムと箱ひげ図を作成する
+    
+    Parameters:
+    -----------
+    values : numpy.ndarray
+        欠損値を含まない浮動小数点の値の配列
+    column : str
+        列名
+        
+    Returns:
+    --------
+    plotly.graph_objects.Figure
+        上段に箱ひげ図、下段にヒストグラムを配置した図
+    """
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.02)
+    
+    if values.size > 0:
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        iqr = q3 - q1
+        
+        # Freedman-Diaconis則でビン数を決め（IQRが0の場合はSturges則）、上限で打ち切る
+        bin_width = 2 * iqr / np.cbrt(values.size)
+        if bin_width > 0:
+            n_bins = int(np.ceil((values.max() - values.min()) / bin_width))
+        else:
+            n_bins = int(np.log2(values.size)) + 1
+        n_bins = min(max(n_bins, 1), MAX_HISTOGRAM_BINS)
+        density, edges = np.histogram(values, bins=n_bins, density=True)
+        
+        # 箱ひげ図のひげの位置（1.5 IQR以内で最も外側の値）
+        lower_fence = values[values >= q1 - 1.5 * iqr].min()
+        upper_fence = values[values <= q3 + 1.5 * iqr].max()
+        
+        fig.add_trace(go.Box(
+            y=[column], q1=[q1], median=[median], q3=[q3],
+            lowerfence=[lower_fence], upperfence=[upper_fence],
+            orientation='h', name=column, showlegend=False
+        ), row=1, col=1)
+        fig.add_trace(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=density,
+            width=np.diff(edges),
+            name=column,
+            showlegend=False
+        ), row=2, col=1)
+    
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
+    fig.update_xaxes(title_text=column, row=2, col=1)
+    fig.update_yaxes(title_text='確率密度', row=2, col=1)
+    fig.update_layout(title=f"{column}の分布", bargap=0)
+    
+    return fig
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _hash_dataframe})
 def perform_distribution_analysis(df, column):
     """
     列の分布分析を行う関数
@@ -376,28 +717,23 @@ def perform_distribution_analysis(df, column):
         results['stats'] = stats
         
         # 歪度と尖度
-        from scipy.stats import skew, kurtosis
-        
         results['skewness'] = skew(df[column].dropna())
         results['kurtosis'] = kurtosis(df[column].dropna())
         
-        # ヒストグラムとKDEプロット
-        fig = px.histogram(
-            df, x=column,
-            histnorm='probability density',
-            title=f"{column}の分布",
-            marginal="box"
-        )
+        values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid_idx = np.flatnonzero(~np.isnan(values))
         
-        results['histogram'] = fig
+        # ヒストグラムと箱ひげ図（生データではなく集計済みの値だけをブラウザに送る）
+        results['histogram'] = _binned_histogram_figure(values[valid_idx], column)
         
         # 正規性検定
-        from scipy.stats import shapiro, normaltest
-        
         # サンプルサイズが大きすぎる場合は小さいサブサンプルで検定
-        sample = df[column].dropna()
-        if len(sample) > 5000:
-            sample = sample.sample(5000, random_state=42)
+        # 欠損値を除いた位置から直接サンプリングし、配列のインデックス参照は1回だけ行う
+        sample_idx = valid_idx
+        if sample_idx.size > 5000:
+            rng = np.random.default_rng(42)
+            sample_idx = rng.choice(sample_idx, 5000, replace=False)
+        sample = values[sample_idx]
         
         if len(sample) >= 20:  # 十分なサンプルサイズがある場合のみ検定
             try:
@@ -412,33 +748,49 @@ def perform_distribution_analysis(df, column):
             except:
                 pass
         
-        # QQプロット
-        from scipy.stats import probplot
-        import io
-        from PIL import Image
-        
-        # QQプロットの作成
-        qq_buf = io.BytesIO()
-        fig_qq, ax = plt.subplots(figsize=(8, 6))
-        probplot(df[column].dropna(), plot=ax)
-        ax.set_title(f"{column}のQQプロット")
-        plt.tight_layout()
-        fig_qq.savefig(qq_buf, format='png')
-        plt.close(fig_qq)
-        
-        # 結果に保存
-        qq_buf.seek(0)
-        results['qq_plot'] = qq_buf
+        # QQプロット（理論分位点と標本分位点を計算し、Plotlyで描画）
+        if sample.size > 0:
+            (osm, osr), (slope, intercept, _) = probplot(sample, plot=None)
+            results['qq_data'] = {'x': osm, 'y': osr, 'fit': (slope, intercept)}
+            
+            fig_qq = go.Figure()
+            fig_qq.add_trace(go.Scatter(x=osm, y=osr, mode='markers', name='標本分位点'))
+            fig_qq.add_trace(go.Scatter(
+                x=[osm[0], osm[-1]],
+                y=[slope * osm[0] + intercept, slope * osm[-1] + intercept],
+                mode='lines', name='近似直線'
+            ))
+            fig_qq.update_layout(
+                title=f"{column}のQQプロット",
+                xaxis_title='理論分位点',
+                yaxis_title='標本分位点'
+            )
+            results['qq_plot'] = fig_qq
         
     else:  # カテゴリ変数の場合
-        # 頻度カウント
-        value_counts = df[column].value_counts()
+        # 頻度カウント（文字列列はカテゴリ型のコードで集計）
+        series = df[column]
+        if series.dtype == object:
+            series = series.astype('category')
+        value_counts = series.value_counts()
+        # 絞り込み後のカテゴリ型の列では使われていないカテゴリが0件として残るため除く
+        value_counts = value_counts[value_counts > 0]
+        if isinstance(value_counts.index, pd.CategoricalIndex):
+            value_counts.index = value_counts.index.astype(object)
         results['value_counts'] = value_counts
-        
-        # 棒グラフ
+        # 非欠損値の総数（頻度表の割合の計算で再集計しないよう保持）
+        results['n_total'] = int(value_counts.sum())
+        
+        # 棒グラフ（カテゴリが多い場合は上位のみ表示し、残りは「その他」にまとめる）
+        plot_counts = value_counts
+        if len(plot_counts) > MAX_BAR_CATEGORIES:
+            plot_counts = pd.concat([
+                plot_counts.iloc[:MAX_BAR_CATEGORIES],
+                pd.Series([plot_counts.iloc[MAX_BAR_CATEGORIES:].sum()], index=['その他'])
+            ])
         fig = px.bar(
-            x=value_counts.index, 
-            y=value_counts.values,
+            x=plot_counts.index.astype(str), 
+            y=plot_counts.values,
             title=f"{column}の値の分布",
             labels={'x': column, 'y': '頻度'},
         )
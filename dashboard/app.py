@@ -1,13 +1,18 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-from PIL import Image
 import io
+import warnings
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# Copy-on-Write を有効にし、データフレームの受け渡しで明示的なコピーを不要にする
+# （pandas 3以降は常に有効で、オプションの設定は非推奨のため pandas 2 のときだけ設定する）
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
 # 自作モジュールのインポート
 # 注: 実行時にはimport errorを防ぐため、同じディレクトリに配置してください
@@ -16,7 +21,8 @@ from advanced_analysis import (
     perform_time_series_analysis,
     perform_correlation_analysis,
     perform_cluster_analysis,
-    perform_distribution_analysis
+    perform_distribution_analysis,
+    compute_correlation_matrix
 )
 
 # ページ設定
@@ -27,6 +33,759 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --------------------------------
+# サンプルデータ生成
+# --------------------------------
+@st.cache_data(ttl="1h")
+def _generate_sales_data():
+    """
+    売上データのサンプルを生成する（シード固定のため結果は常に同じで、セッション間で共有できる）
+    """
+    # 日付範囲の生成
+    date_range = pd.date_range(start='2023-01-01', end='2023-12-31', freq='D')
+    
+    # 売上データの生成
+    np.random.seed(42)  # 再現性のための固定シード
+    sales_data = {
+        '日付': date_range,
+        '売上': np.random.normal(1000, 200, len(date_range)),
+        '商品A': np.random.normal(500, 100, len(date_range)),
+        '商品B': np.random.normal(300, 80, len(date_range)),
+        '商品C': np.random.normal(200, 50, len(date_range)),
+    }
+    
+    # 季節性を追加（日付の属性からマスクを作り、列ごとにまとめて掛け合わせる）
+    dayofweek = date_range.dayofweek.values
+    day = date_range.day.values
+    month = date_range.month.values
+    
+    weekend = dayofweek >= 5  # 5:土曜日, 6:日曜日
+    month_start = day <= 5
+    summer = np.isin(month, [6, 7, 8])
+    winter = np.isin(month, [11, 12, 1])
+    
+    # 週末は売上増加
+    sales_data['売上'][weekend] *= 1.5
+    sales_data['商品A'][weekend] *= 1.3
+    sales_data['商品B'][weekend] *= 1.7
+    sales_data['商品C'][weekend] *= 1.4
+    
+    # 月の初めは売上増加
+    sales_data['売上'][month_start] *= 1.2
+    
+    # 季節トレンド（夏と冬に売上増加）
+    sales_data['売上'][summer] *= 1.1
+    sales_data['商品A'][summer] *= 1.3
+    sales_data['売上'][winter] *= 1.2
+    sales_data['商品B'][winter] *= 1.4
+    
+    df = pd.DataFrame(sales_data)
+    
+    return df
+
+
+@st.cache_data(ttl="1h")
+def _generate_stock_data():
+    """
+    株価データのサンプルを生成する（シード固定のため結果は常に同じで、セッション間で共有できる）
+    """
+    # 日付範囲（営業日のみ）
+    date_range = pd.bdate_range(start='2023-01-01', end='2023-12-31')
+    
+    np.random.seed(42)  # 再現性のための固定シード
+    
+    # 初期株価
+    initial_price = 1000
+    
+    # ランダムウォークで株価を生成
+    price_changes = np.random.normal(0.0005, 0.015, len(date_range))
+    prices = initial_price * np.cumprod(1.0 + price_changes)
+    
+    # ボリューム（取引量）を生成
+    volume = np.random.normal(1000000, 200000, len(date_range))
+    
+    # データフレーム作成
+    stock_data = {
+        '日付': date_range,
+        '始値': prices * np.random.normal(0.995, 0.002, len(prices)),
+        '高値': prices * np.random.normal(1.01, 0.003, len(prices)),
+        '安値': prices * np.random.normal(0.99, 0.003, len(prices)),
+        '終値': prices,
+        '出来高': volume
+    }
+    
+    df = pd.DataFrame(stock_data)
+    
+    # 一貫性のある価格データにする（高値は始値・終値の大きい方以上、安値は小さい方以下）
+    open_close_max = np.maximum(df['始値'].values, df['終値'].values)
+    open_close_min = np.minimum(df['始値'].values, df['終値'].values)
+    df['高値'] = open_close_max * np.random.uniform(1.001, 1.015, len(df))
+    df['安値'] = open_close_min * np.random.uniform(0.985, 0.999, len(df))
+    
+    return df
+
+
+@st.cache_data(ttl="1h")
+def _generate_weather_data():
+    """
+    気象データのサンプルを生成する（シード固定のため結果は常に同じで、セッション間で共有できる）
+    """
+    # 日付範囲の生成
+    date_range = pd.date_range(start='2023-01-01', end='2023-12-31', freq='D')
+    
+    np.random.seed(42)  # 再現性のための固定シード
+    
+    # 気温データ生成（季節性を持たせる）
+    temp_base = 15  # 平均気温の基準値
+    temp_amplitude = 10  # 年間の気温振幅
+    
+    # 日付から年間の位置（0〜1）を計算
+    day_of_year = date_range.dayofyear.values
+    year_progress = day_of_year / 365.25
+    n_days = len(day_of_year)
+    
+    # 季節性を持つ気温を生成（夏に最高、冬に最低）
+    seasonal_component = temp_amplitude * np.sin(2 * np.pi * (year_progress - 0.25))
+    daily_variation = np.random.normal(0, 2, n_days)  # 日々のランダム変動
+    temperatures = temp_base + seasonal_component + daily_variation
+    
+    # 湿度（気温と逆相関）
+    base_humidity = 70 - seasonal_component  # 夏は乾燥、冬は湿度高め
+    humidity_variation = np.random.normal(0, 5, n_days)
+    humidity = np.clip(base_humidity + humidity_variation, 10, 100)  # 10%〜100%に制限
+    
+    # 降水量（確率的に発生、湿度が高いほど確率上昇）
+    rain_prob = humidity / 100  # 湿度を降水確率として使用
+    rain_mask = np.random.random(n_days) < rain_prob * 0.3  # 降水確率を調整
+    precipitation = np.where(rain_mask, np.random.exponential(5, n_days), 0.0)  # 指数分布で降水量を生成
+    
+    # 風速
+    wind_speed = np.random.gamma(2, 1.5, n_days)  # ガンマ分布で風速を生成
+    
+    weather_data = {
+        '日付': date_range,
+        '気温(℃)': temperatures,
+        '湿度(%)': humidity,
+        '降水量(mm)': precipitation,
+        '風速(m/s)': wind_speed
+    }
+    
+    df = pd.DataFrame(weather_data)
+    
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def _dataset_info(df):
+    """
+    データセット情報パネル用の集計（形状・欠損値の総数・メモリ使用量）を返す
+    """
+    return df.shape, int(df.isna().to_numpy().sum()), int(df.memory_usage(deep=True).sum())
+
+
+@st.cache_data(show_spinner=False)
+def _describe_numeric(numeric_df):
+    """
+    数値列の要約統計量を列ごとに計算する（describe().T と同じ形式）
+    
+    全列を1つのfloat64配列にまとめ、平均・標準偏差と
+    最小値・四分位数・最大値（1回のpercentile呼び出し）を列方向に一括で計算する
+    
+    Parameters:
+    -----------
+    numeric_df : pandas.DataFrame
+        数値列のみのデータフレーム
+        
+    Returns:
+    --------
+    pandas.DataFrame
+        各列を行とし、count/mean/std/min/25%/50%/75%/max を列とする統計量
+    """
+    if len(numeric_df) == 0:
+        return numeric_df.describe().T
+    
+    values = numeric_df.to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    
+    with warnings.catch_warnings():
+        # 全て欠損の列はNaNとする（describeと同じ結果）
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        if missing.any():
+            mean = np.nanmean(values, axis=0)
+            std = np.nanstd(values, axis=0, ddof=1)
+            percentiles = np.nanpercentile(values, [0, 25, 50, 75, 100], axis=0)
+        else:
+            mean = values.mean(axis=0)
+            std = values.std(axis=0, ddof=1)
+            percentiles = np.percentile(values, [0, 25, 50, 75, 100], axis=0)
+    
+    return pd.DataFrame({
+        'count': (~missing).sum(axis=0).astype(np.float64),
+        'mean': mean,
+        'std': std,
+        'min': percentiles[0],
+        '25%': percentiles[1],
+        '50%': percentiles[2],
+        '75%': percentiles[3],
+        'max': percentiles[4]
+    }, index=numeric_df.columns)
+
+
+def _dtypes_signature(df):
+    """
+    列名と型だけからなるキャッシュキー（データ本体はハッシュしない）
+    """
+    return tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes)
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _dtypes_signature})
+def _numeric_columns(df):
+    """
+    数値列と非数値列の列名リストを返す（列構成が変わらない限り再計算しない）
+    """
+    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+    non_numeric_cols = df.select_dtypes(exclude=np.number).columns.tolist()
+    return numeric_cols, non_numeric_cols
+
+
+@st.cache_data(show_spinner=False)
+def _iqr_outlier_stats(numeric_df):
+    """
+    全数値列のIQRしきい値と外れ値の数を一括で計算する
+    
+    Parameters:
+    -----------
+    numeric_df : pandas.DataFrame
+        数値列のみのデータフレーム
+        
+    Returns:
+    --------
+    pandas.DataFrame
+        列名をインデックスとし、下限しきい値・上限しきい値・外れ値の数を列とする表
+    """
+    values = numeric_df.to_numpy(dtype=np.float64, na_value=np.nan)
+    
+    with warnings.catch_warnings():
+        # 全て欠損の列のしきい値はNaNとする
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        Q1, Q3 = np.nanpercentile(values, [25, 75], axis=0) if len(values) else np.full((2, values.shape[1]), np.nan)
+    
+    IQR = Q3 - Q1
+    lower_bound = Q1 - 1.5 * IQR
+    upper_bound = Q3 + 1.5 * IQR
+    
+    # NaNとの比較は常にFalseのため欠損値は外れ値に数えない
+    n_outliers = ((values < lower_bound) | (values > upper_bound)).sum(axis=0)
+    
+    return pd.DataFrame({
+        '下限しきい値': lower_bound,
+        '上限しきい値': upper_bound,
+        '外れ値の数': n_outliers
+    }, index=numeric_df.columns)
+
+
+def _value_counts_table(dist_results):
+    """
+    カテゴリ変数の分布分析結果から頻度表（値・頻度・割合）を作成する
+    
+    割合は分析時に求めた非欠損値の総数から計算し、頻度を再集計しない
+    """
+    value_counts = dist_results['value_counts']
+    counts = value_counts.to_numpy()
+    n_total = dist_results.get('n_total', int(counts.sum()))
+    
+    return pd.DataFrame({
+        '値': value_counts.index,
+        '頻度': counts,
+        '割合 (%)': np.multiply(counts, 100.0 / max(n_total, 1)).round(2)
+    })
+
+
+def _value_counts_markdown(dist_results):
+    """
+    カテゴリ変数の頻度表をレポート用のMarkdown形式の文字列として直接作成する（中間のデータフレームを作らない）
+    """
+    value_counts = dist_results['value_counts']
+    n_total = dist_results.get('n_total', int(value_counts.sum()))
+    ratio = 100.0 / max(n_total, 1)
+    
+    rows = [
+        f"| {str(value).replace('|', '&#124;')} | {count} | {count * ratio:.2f} |"
+        for value, count in value_counts.items()
+    ]
+    return "\n".join(["| 値 | 頻度 | 割合 (%) |", "|:---|---:|---:|", *rows])
+
+
+def _csv_bytes(df):
+    """
+    データフレームを pandas の to_csv(index=False) と同じ書式のCSVのバイト列に変換する
+    
+    PyArrowでバイト列に直接書き出す。日時・真偽値の列は pandas と同じ表記の文字列にしてから書き出し、
+    引用符が必要な値がある場合やArrow型に変換できない列がある場合は pandas で書き出す
+    """
+    converted = df.copy(deep=False)
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_bool_dtype(series):
+            converted[col] = series.astype(str).where(series.notna())
+    
+    try:
+        # 見出し行は pandas で書き、値の行だけを引用符なしでPyArrowで書き出す
+        buffer = io.BytesIO(df.iloc[:0].to_csv(index=False, lineterminator='\n').encode())
+        buffer.seek(0, io.SEEK_END)
+        pa_csv.write_csv(
+            pa.Table.from_pandas(converted, preserve_index=False), buffer,
+            write_options=pa_csv.WriteOptions(include_header=False, quoting_style='none')
+        )
+        return buffer.getvalue()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return df.to_csv(index=False).encode()
+
+# レポートのユニーク値数を数える最大行数
+REPORT_NUNIQUE_SAMPLE_SIZE = 50000
+
+
+@st.cache_data(show_spinner=False)
+def _table_markdown(table):
+    """
+    レポート用に表をMarkdown形式の文字列に変換する（同じ表の変換結果は再利用する）
+    """
+    return table.to_markdown()
+
+# 日付列の判定に使う先頭の非欠損値の数と、日付とみなす変換成功率
+DATETIME_SAMPLE_SIZE = 50
+DATETIME_PARSE_RATIO = 0.9
+
+
+def _datetime_detection_key(df):
+    """
+    日付列検出用のキャッシュキー（列名・型・形状と先頭行のハッシュのみで、全行はハッシュしない）
+    """
+    head_hash = int(pd.util.hash_pandas_object(df.head(DATETIME_SAMPLE_SIZE), index=False).sum())
+    return df.shape, tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), head_hash
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _datetime_detection_key})
+def _detect_datetime_columns(df):
+    """
+    日付型の列、または日付に変換可能な文字列の列を検出する
+    
+    まず列の型を確認し、日付型でも数値型でもない列についてのみ
+    先頭の非欠損値をサンプルとして日付への変換を試す
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        対象のデータフレーム
+        
+    Returns:
+    --------
+    list
+        日付列とみなせる列名のリスト
+    """
+    datetime_cols = []
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            datetime_cols.append(col)
+            continue
+        
+        # 数値・真偽値の列はエポック秒として解釈できてしまうため対象外
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            continue
+        
+        sample = series.dropna().head(DATETIME_SAMPLE_SIZE)
+        if sample.empty:
+            continue
+        
+        try:
+            parsed = pd.to_datetime(sample, errors='coerce', cache=True)
+        except (ValueError, TypeError):
+            # 混在した型などで変換自体ができない列は日付列とみなさない
+            continue
+        
+        if parsed.notna().mean() > DATETIME_PARSE_RATIO:
+            datetime_cols.append(col)
+    
+    return datetime_cols
+
+@st.cache_data(show_spinner=False)
+def _parse_datetime_column(series):
+    """
+    列全体を日付型に変換する（変換できない値はNaT。同じ列の変換結果は再実行時に再利用する）
+    """
+    return pd.to_datetime(series, errors='coerce', cache=True, format='mixed')
+
+# ユニーク値の割合がこれ未満の文字列列はカテゴリ型に変換する
+CATEGORY_RATIO_THRESHOLD = 0.5
+
+
+def _convert_low_cardinality_to_category(df):
+    """
+    ユニーク値の少ない文字列（object型・文字列型）の列をカテゴリ型に変換する
+    
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        読み込んだデータフレーム（その場で変換する）
+        
+    Returns:
+    --------
+    pandas.DataFrame
+        変換後のデータフレーム
+    """
+    n_rows = max(len(df), 1)
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if df[col].nunique(dropna=False) / n_rows < CATEGORY_RATIO_THRESHOLD:
+            df[col] = df[col].astype('category')
+    
+    return df
+
+
+def _value_counts(series):
+    """
+    値ごとの頻度を求める（カテゴリ型の列で、絞り込みなどにより使われていないカテゴリの0件の行は含めない）
+    """
+    value_counts = series.value_counts()
+    return value_counts[value_counts > 0]
+
+
+# --------------------------------
+# データ探索の描画
+# --------------------------------
+# 折れ線グラフでブラウザに送る1系列あたりの最大点数
+LTTB_MAX_POINTS = 2000
+# 散布図でブラウザに送る最大点数
+SCATTER_MAX_POINTS = 50000
+
+
+def _lttb_indices(y, n_out):
+    """
+    LTTB（Largest-Triangle-Three-Buckets）法で間引く点のインデックスを求める
+    
+    X座標はデータの並び順（等間隔）とみなし、各バケットから
+    前後の点と作る三角形の面積が最大となる点を1つずつ選ぶ
+    
+    Parameters:
+    -----------
+    y : numpy.ndarray
+        欠損値を含まない値の配列
+    n_out : int
+        間引き後の点数
+        
+    Returns:
+    --------
+    numpy.ndarray
+        残す点のインデックス（昇順）
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    
+    x = np.arange(n, dtype=np.float64)
+    # 最初と最後の点を除いた範囲を n_out - 2 個のバケットに分割
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    
+    selected = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # 次のバケットの平均点（最後のバケットでは最終点）
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+    
+    return indices
+
+
+@st.cache_data(show_spinner=False)
+def _correlation_heatmap_figure(numeric_df):
+    """
+    相関係数ヒートマップの図を作成する（データが変わらない限り再作成しない）
+    """
+    # 相関行列の計算（欠損値がなければfloat32の行列積で計算）
+    corr_matrix = compute_correlation_matrix(numeric_df)
+    
+    return px.imshow(
+        corr_matrix,
+        text_auto=True,
+        aspect="auto",
+        color_continuous_scale='RdBu_r',
+        title="相関係数ヒートマップ"
+    )
+
+
+@st.fragment
+def _render_visualization_tab(df, numeric_cols):
+    """
+    可視化タブを描画する（フラグメントとして、このタブのウィジェット操作時はこの部分だけ再実行される）
+    """
+    st.subheader("データ可視化")
+    
+    # グラフの種類を選択
+    chart_type = st.selectbox(
+        "グラフの種類",
+        ["折れ線グラフ", "棒グラフ", "散布図", "ヒストグラム", "箱ひげ図", "パイチャート", "ヒートマップ"]
+    )
+    
+    if chart_type == "折れ線グラフ":
+        # X軸として使用する列
+        x_column = st.selectbox(
+            "X軸（時間軸）の列を選択",
+            df.columns.tolist()
+        )
+        
+        # Y軸として使用する列
+        y_columns = st.multiselect(
+            "Y軸の列を選択（複数選択可）",
+            numeric_cols
+        )
+        
+        if x_column and y_columns:
+            try:
+                if len(df) > LTTB_MAX_POINTS:
+                    # 点数が多い場合はLTTBで間引いてからWebGLで描画
+                    fig = go.Figure()
+                    for y_column in y_columns:
+                        y_values = df[y_column].to_numpy(dtype=np.float64, na_value=np.nan)
+                        valid = np.flatnonzero(~np.isnan(y_values))
+                        keep = valid[_lttb_indices(y_values[valid], LTTB_MAX_POINTS)]
+                        fig.add_trace(go.Scattergl(
+                            x=df[x_column].to_numpy()[keep],
+                            y=y_values[keep],
+                            mode='lines',
+                            name=y_column
+                        ))
+                    fig.update_layout(title="時系列データ", xaxis_title=x_column)
+                else:
+                    fig = px.line(df, x=x_column, y=y_columns, title="時系列データ")
+                st.plotly_chart(fig, use_container_width=True)
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "棒グラフ":
+        # X軸として使用する列
+        x_column = st.selectbox(
+            "X軸（カテゴリ）の列を選択",
+            df.columns.tolist()
+        )
+        
+        # Y軸として使用する列
+        y_column = st.selectbox(
+            "Y軸（数値）の列を選択",
+            numeric_cols if numeric_cols else ["なし"]
+        )
+        
+        if x_column and y_column != "なし":
+            # カテゴリ数が多すぎる場合は上位N件に制限
+            max_categories = st.slider("表示するカテゴリ数", 5, 30, 10)
+            
+            try:
+                # 集計方法を選択
+                agg_method = st.selectbox(
+                    "集計方法",
+                    ["合計", "平均", "中央値", "最大値", "最小値"]
+                )
+                
+                # 集計方法に応じてデータを集計
+                agg_func = {
+                    "合計": "sum",
+                    "平均": "mean",
+                    "中央値": "median",
+                    "最大値": "max",
+                    "最小値": "min"
+                }[agg_method]
+                
+                # データを集計し、トップNのカテゴリのみを取り出す（全件ソートはしない）
+                agg_data = df.groupby(x_column, observed=True)[y_column].agg(agg_func).nlargest(max_categories)
+                
+                fig = px.bar(
+                    x=agg_data.index, 
+                    y=agg_data.values,
+                    title=f"{x_column}ごとの{y_column}の{agg_method}"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "散布図":
+        # X軸として使用する列
+        x_column = st.selectbox(
+            "X軸の列を選択",
+            numeric_cols if numeric_cols else ["なし"]
+        )
+        
+        # Y軸として使用する列
+        y_column = st.selectbox(
+            "Y軸の列を選択",
+            numeric_cols if numeric_cols else ["なし"],
+            index=min(1, len(numeric_cols)-1) if len(numeric_cols) > 1 else 0
+        )
+        
+        # 色分け用の列（オプション）
+        color_column = st.selectbox(
+            "色分け用の列（オプション）",
+            ["なし"] + df.columns.tolist()
+        )
+        
+        color_column = None if color_column == "なし" else color_column
+        
+        if x_column != "なし" and y_column != "なし":
+            try:
+                # 点数が多い場合は表示用にサンプリングし、WebGLで描画する
+                plot_df = df.sample(SCATTER_MAX_POINTS, random_state=0) if len(df) > SCATTER_MAX_POINTS else df
+                fig = px.scatter(
+                    plot_df, 
+                    x=x_column, 
+                    y=y_column, 
+                    color=color_column,
+                    render_mode='webgl',
+                    title=f"{x_column} vs {y_column}"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                if len(plot_df) < len(df):
+                    st.caption(f"全{len(df)}行のうち{SCATTER_MAX_POINTS}行をランダムに抽出して表示しています。")
+                
+                # 相関係数の表示（両方の値がある行だけでNumPyで計算）
+                x_values = df[x_column].to_numpy(dtype=np.float64, na_value=np.nan)
+                y_values = df[y_column].to_numpy(dtype=np.float64, na_value=np.nan)
+                valid = ~(np.isnan(x_values) | np.isnan(y_values))
+                if np.count_nonzero(valid) > 1:
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        correlation = float(np.corrcoef(x_values[valid], y_values[valid])[0, 1])
+                else:
+                    correlation = np.nan
+                st.metric("相関係数", f"{correlation:.4f}")
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "ヒストグラム":
+        # 列を選択
+        column = st.selectbox(
+            "列を選択",
+            numeric_cols if numeric_cols else ["なし"]
+        )
+        
+        if column != "なし":
+            try:
+                # ビンの数を設定
+                bin_count = st.slider("ビン（区間）の数", 5, 100, 20)
+                
+                # 正規化するかどうか
+                normalize = st.checkbox("確率密度に正規化", value=False)
+                
+                # ヒストグラムを描画
+                fig = px.histogram(
+                    df, x=column, 
+                    nbins=bin_count, 
+                    title=f"{column}のヒストグラム",
+                    histnorm='probability density' if normalize else None,
+                    marginal="box"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+                
+                # 基本統計量
+                stats = df[column].describe()
+                st.write(f"平均値: {stats['mean']:.2f}, 標準偏差: {stats['std']:.2f}")
+                st.write(f"最小値: {stats['min']:.2f}, 最大値: {stats['max']:.2f}")
+                st.write(f"第1四分位数: {stats['25%']:.2f}, 中央値: {stats['50%']:.2f}, 第3四分位数: {stats['75%']:.2f}")
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "箱ひげ図":
+        # Y軸として使用する列
+        y_column = st.selectbox(
+            "数値列を選択",
+            numeric_cols if numeric_cols else ["なし"]
+        )
+        
+        # グループ化の列（オプション）
+        x_column = st.selectbox(
+            "グループ化する列（オプション）",
+            ["なし"] + df.columns.tolist()
+        )
+        
+        x_column = None if x_column == "なし" else x_column
+        
+        if y_column != "なし":
+            try:
+                if x_column:
+                    # カテゴリ数が多すぎる場合は上位N件に制限
+                    categories = _value_counts(df[x_column]).index
+                    max_categories = st.slider("表示するカテゴリ数", 2, 30, min(10, len(categories)))
+                    top_categories = categories[:max_categories]
+                    
+                    boxplot_data = df[df[x_column].isin(top_categories)]
+                else:
+                    boxplot_data = df
+                
+                fig = px.box(
+                    boxplot_data, 
+                    x=x_column, 
+                    y=y_column,
+                    title=f"{y_column}の分布" + (f"（{x_column}ごと）" if x_column else "")
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "パイチャート":
+        # カテゴリ列を選択
+        column = st.selectbox(
+            "カテゴリ列を選択",
+            df.columns.tolist()
+        )
+        
+        if column:
+            try:
+                # カテゴリ数が多すぎる場合は上位N件に制限し、残りは「その他」にまとめる
+                max_categories = st.slider("表示するカテゴリ数", 2, 20, 5)
+                
+                # カテゴリごとの集計
+                counts = _value_counts(df[column])
+                
+                # トップNとその他に分類
+                if len(counts) > max_categories:
+                    top_counts = counts.iloc[:max_categories]
+                    other_count = counts.iloc[max_categories:].sum()
+                    
+                    labels = list(top_counts.index) + ['その他']
+                    values = list(top_counts.values) + [other_count]
+                else:
+                    labels = counts.index
+                    values = counts.values
+                
+                fig = px.pie(
+                    names=labels, 
+                    values=values,
+                    title=f"{column}の分布"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+    
+    elif chart_type == "ヒートマップ":
+        if len(numeric_cols) < 2:
+            st.warning("ヒートマップを作成するには、少なくとも2つの数値列が必要です。")
+        else:
+            try:
+                # ヒートマップの作成（同じデータでは前回の図を再利用）
+                fig = _correlation_heatmap_figure(df[numeric_cols])
+                st.plotly_chart(fig, use_container_width=True)
+            except Exception as e:
+                st.error(f"グラフの作成に失敗しました: {e}")
+
+
 # セッション状態の初期化
 if 'data' not in st.session_state:
     st.session_state.data = None
@@ -67,138 +826,13 @@ if app_mode == "データ読み込み":
             ["売上データ", "株価データ", "気象データ"]
         )
         
-        # サンプルデータの生成
-        if sample_data_type == "売上データ":
-            # 日付範囲の生成
-            date_range = pd.date_range(start='2023-01-01', end='2023-12-31', freq='D')
-            
-            # 売上データの生成
-            np.random.seed(42)  # 再現性のための固定シード
-            sales_data = {
-                '日付': date_range,
-                '売上': np.random.normal(1000, 200, len(date_range)),
-                '商品A': np.random.normal(500, 100, len(date_range)),
-                '商品B': np.random.normal(300, 80, len(date_range)),
-                '商品C': np.random.normal(200, 50, len(date_range)),
-            }
-            
-            # 季節性を追加
-            for i, date in enumerate(date_range):
-                # 週末は売上増加
-                if date.dayofweek >= 5:  # 5:土曜日, 6:日曜日
-                    sales_data['売上'][i] *= 1.5
-                    sales_data['商品A'][i] *= 1.3
-                    sales_data['商品B'][i] *= 1.7
-                    sales_data['商品C'][i] *= 1.4
-                
-                # 月の初めは売上増加
-                if date.day <= 5:
-                    sales_data['売上'][i] *= 1.2
-                
-                # 季節トレンド（夏と冬に売上増加）
-                month = date.month
-                if month in [6, 7, 8]:  # 夏
-                    sales_data['売上'][i] *= 1.1
-                    sales_data['商品A'][i] *= 1.3
-                elif month in [11, 12, 1]:  # 冬
-                    sales_data['売上'][i] *= 1.2
-                    sales_data['商品B'][i] *= 1.4
-            
-            df = pd.DataFrame(sales_data)
-            
-        elif sample_data_type == "株価データ":
-            # 日付範囲（営業日のみ）
-            date_range = pd.bdate_range(start='2023-01-01', end='2023-12-31')
-            
-            np.random.seed(42)  # 再現性のための固定シード
-            
-            # 初期株価
-            initial_price = 1000
-            
-            # ランダムウォークで株価を生成
-            price_changes = np.random.normal(0.0005, 0.015, len(date_range))
-            prices = [initial_price]
-            
-            for change in price_changes:
-                prices.append(prices[-1] * (1 + change))
-            
-            prices = prices[1:]  # 最初の要素を削除
-            
-            # ボリューム（取引量）を生成
-            volume = np.random.normal(1000000, 200000, len(date_range))
-            
-            # データフレーム作成
-            stock_data = {
-                '日付': date_range,
-                '始値': prices * np.random.normal(0.995, 0.002, len(prices)),
-                '高値': prices * np.random.normal(1.01, 0.003, len(prices)),
-                '安値': prices * np.random.normal(0.99, 0.003, len(prices)),
-                '終値': prices,
-                '出来高': volume
-            }
-            
-            df = pd.DataFrame(stock_data)
-            
-            # 一貫性のある価格データにする
-            for i in range(len(df)):
-                high = max(df.loc[i, '始値'], df.loc[i, '終値']) * np.random.uniform(1.001, 1.015)
-                low = min(df.loc[i, '始値'], df.loc[i, '終値']) * np.random.uniform(0.985, 0.999)
-                df.loc[i, '高値'] = high
-                df.loc[i, '安値'] = low
-            
-        elif sample_data_type == "気象データ":
-            # 日付範囲の生成
-            date_range = pd.date_range(start='2023-01-01', end='2023-12-31', freq='D')
-            
-            np.random.seed(42)  # 再現性のための固定シード
-            
-            # 気温データ生成（季節性を持たせる）
-            temp_base = 15  # 平均気温の基準値
-            temp_amplitude = 10  # 年間の気温振幅
-            
-            temperatures = []
-            humidity = []
-            precipitation = []
-            wind_speed = []
-            
-            for date in date_range:
-                # 日付から年間の位置（0〜1）を計算
-                day_of_year = date.dayofyear
-                year_progress = day_of_year / 365.25
-                
-                # 季節性を持つ気温を生成（夏に最高、冬に最低）
-                seasonal_component = temp_amplitude * np.sin(2 * np.pi * (year_progress - 0.25))
-                daily_variation = np.random.normal(0, 2)  # 日々のランダム変動
-                temp = temp_base + seasonal_component + daily_variation
-                temperatures.append(temp)
-                
-                # 湿度（気温と逆相関）
-                base_humidity = 70 - seasonal_component  # 夏は乾燥、冬は湿度高め
-                humidity_variation = np.random.normal(0, 5)
-                hum = max(min(base_humidity + humidity_variation, 100), 10)  # 10%〜100%に制限
-                humidity.append(hum)
-                
-                # 降水量（確率的に発生、湿度が高いほど確率上昇）
-                rain_prob = hum / 100  # 湿度を降水確率として使用
-                if np.random.random() < rain_prob * 0.3:  # 降水確率を調整
-                    rain_amount = np.random.exponential(5)  # 指数分布で降水量を生成
-                else:
-                    rain_amount = 0
-                precipitation.append(rain_amount)
-                
-                # 風速
-                wind = np.random.gamma(2, 1.5)  # ガンマ分布で風速を生成
-                wind_speed.append(wind)
-            
-            weather_data = {
-                '日付': date_range,
-                '気温(℃)': temperatures,
-                '湿度(%)': humidity,
-                '降水量(mm)': precipitation,
-                '風速(m/s)': wind_speed
-            }
-            
-            df = pd.DataFrame(weather_data)
+        # サンプルデータの生成（キャッシュ済みの生成関数を呼ぶ）
+        df = {
+            "売上データ": _generate_sales_data,
+            "株価データ": _generate_stock_data,
+            "気象データ": _generate_weather_data
+        }[sample_data_type]()
+        df = _convert_low_cardinality_to_category(df)
         
         # データフレームの表示
         st.subheader("データプレビュー")
@@ -206,18 +840,19 @@ if app_mode == "データ読み込み":
         
         # データの詳細情報を表示
         st.subheader("データセット情報")
+        (n_rows, n_cols), n_missing, memory_bytes = _dataset_info(df)
         col1, col2 = st.columns(2)
         with col1:
-            st.write(f"行数: {df.shape[0]}")
-            st.write(f"列数: {df.shape[1]}")
+            st.write(f"行数: {n_rows}")
+            st.write(f"列数: {n_cols}")
         with col2:
-            st.write(f"欠損値の数: {df.isnull().sum().sum()}")
-            st.write(f"メモリ使用量: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+            st.write(f"欠損値の数: {n_missing}")
+            st.write(f"メモリ使用量: {memory_bytes / 1024:.2f} KB")
         
         # データの保存
         if st.button("このデータセットを使用"):
             st.session_state.data = df
-            st.session_state.processed_data = df.copy()
+            st.session_state.processed_data = df
             st.success("データセットを読み込みました。左のサイドバーから「データ探索」を選択して分析を開始できます。")
     
     elif data_source == "CSVファイルをアップロード":
@@ -242,8 +877,16 @@ if app_mode == "データ読み込み":
                     format_func=lambda x: "カンマ (,)" if x == "," else "セミコロン (;)" if x == ";" else "タブ (\\t)"
                 )
                 
-                # CSVファイルの読み込み
-                df = pd.read_csv(uploaded_file, encoding=encoding, delimiter=delimiter)
+                # CSVファイルの読み込み（マルチスレッドのPyArrowパーサーを優先）
+                try:
+                    df = pd.read_csv(uploaded_file, encoding=encoding, delimiter=delimiter, engine='pyarrow')
+                except ValueError:
+                    # PyArrowで解釈できない形式の場合は通常のパーサーで読み直す
+                    uploaded_file.seek(0)
+                    df = pd.read_csv(uploaded_file, encoding=encoding, delimiter=delimiter)
+                
+                # ユニーク値の少ない文字列列はカテゴリ型にする
+                df = _convert_low_cardinality_to_category(df)
                 
                 # データフレームの表示
                 st.subheader("データプレビュー")
@@ -251,18 +894,19 @@ if app_mode == "データ読み込み":
                 
                 # データの詳細情報を表示
                 st.subheader("データセット情報")
+                (n_rows, n_cols), n_missing, memory_bytes = _dataset_info(df)
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.write(f"行数: {df.shape[0]}")
-                    st.write(f"列数: {df.shape[1]}")
+                    st.write(f"行数: {n_rows}")
+                    st.write(f"列数: {n_cols}")
                 with col2:
-                    st.write(f"欠損値の数: {df.isnull().sum().sum()}")
-                    st.write(f"メモリ使用量: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+                    st.write(f"欠損値の数: {n_missing}")
+                    st.write(f"メモリ使用量: {memory_bytes / 1024:.2f} KB")
                 
                 # データの保存
                 if st.button("このデータセットを使用"):
                     st.session_state.data = df
-                    st.session_state.processed_data = df.copy()
+                    st.session_state.processed_data = df
                     st.success("データセットを読み込みました。左のサイドバーから「データ探索」を選択して分析を開始できます。")
             
             except Exception as e:
@@ -282,8 +926,19 @@ if app_mode == "データ読み込み":
                     xls.sheet_names
                 )
                 
-                # ファイルの読み込み
-                df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
+                # 読み込む行数の上限（大きなシートを部分的に確認する場合）
+                max_rows = st.number_input(
+                    "読み込む最大行数（0の場合は全行）",
+                    min_value=0,
+                    value=0,
+                    step=1000
+                )
+                
+                # ファイルの読み込み（開いたブックを再利用し、ファイルを再解析しない）
+                df = xls.parse(sheet_name=sheet_name, nrows=int(max_rows) if max_rows > 0 else None)
+                
+                # ユニーク値の少ない文字列列はカテゴリ型にする
+                df = _convert_low_cardinality_to_category(df)
                 
                 # データフレームの表示
                 st.subheader("データプレビュー")
@@ -291,18 +946,19 @@ if app_mode == "データ読み込み":
                 
                 # データの詳細情報を表示
                 st.subheader("データセット情報")
+                (n_rows, n_cols), n_missing, memory_bytes = _dataset_info(df)
                 col1, col2 = st.columns(2)
                 with col1:
-                    st.write(f"行数: {df.shape[0]}")
-                    st.write(f"列数: {df.shape[1]}")
+                    st.write(f"行数: {n_rows}")
+                    st.write(f"列数: {n_cols}")
                 with col2:
-                    st.write(f"欠損値の数: {df.isnull().sum().sum()}")
-                    st.write(f"メモリ使用量: {df.memory_usage(deep=True).sum() / 1024:.2f} KB")
+                    st.write(f"欠損値の数: {n_missing}")
+                    st.write(f"メモリ使用量: {memory_bytes / 1024:.2f} KB")
                 
                 # データの保存
                 if st.button("このデータセットを使用"):
                     st.session_state.data = df
-                    st.session_state.processed_data = df.copy()
+                    st.session_state.processed_data = df
                     st.success("データセットを読み込みました。左のサイドバーから「データ探索」を選択して分析を開始できます。")
             
             except Exception as e:
@@ -337,13 +993,16 @@ elif app_mode == "データ探索":
             st.subheader("データ型情報")
             
             # 列ごとのデータ型とデータ例を表形式で表示
+            # 各列の最初の非欠損値は後方補完した先頭行から一度に取得する
+            null_counts = df.isnull().sum()
+            first_valid = df.bfill().iloc[0] if len(df) > 0 else pd.Series(np.nan, index=df.columns)
             dtype_df = pd.DataFrame({
                 'データ型': df.dtypes,
                 '非欠損値数': df.count(),
-                '欠損値数': df.isnull().sum(),
-                '欠損率(%)': (df.isnull().sum() / len(df) * 100).round(2),
+                '欠損値数': null_counts,
+                '欠損率(%)': (null_counts / len(df) * 100).round(2),
                 'ユニーク値数': df.nunique(),
-                'サンプル値': [str(df[col].dropna().iloc[0]) if not df[col].dropna().empty else '' for col in df.columns]
+                'サンプル値': [str(value) if pd.notna(value) else '' for value in first_valid]
             })
             
             st.dataframe(dtype_df)
@@ -353,13 +1012,12 @@ elif app_mode == "データ探索":
             st.subheader("統計要約")
             
             # 数値列と非数値列を分ける
-            numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-            non_numeric_cols = df.select_dtypes(exclude=np.number).columns.tolist()
+            numeric_cols, non_numeric_cols = _numeric_columns(df)
             
             # 数値列の統計量
             if numeric_cols:
                 st.subheader("数値列の統計量")
-                st.dataframe(df[numeric_cols].describe().T)
+                st.dataframe(_describe_numeric(df[numeric_cols]))
             
             # 非数値列の統計量
             if non_numeric_cols:
@@ -367,257 +1025,13 @@ elif app_mode == "データ探索":
                 for col in non_numeric_cols:
                     st.write(f"**{col}** のトップ値:")
                     try:
-                        st.dataframe(df[col].value_counts().head(5))
+                        st.dataframe(_value_counts(df[col]).head(5))
                     except:
                         st.write("この列の集計に失敗しました。")
         
         # 可視化タブ
         with explore_tabs[2]:
-            st.subheader("データ可視化")
-            
-            # グラフの種類を選択
-            chart_type = st.selectbox(
-                "グラフの種類",
-                ["折れ線グラフ", "棒グラフ", "散布図", "ヒストグラム", "箱ひげ図", "パイチャート", "ヒートマップ"]
-            )
-            
-            if chart_type == "折れ線グラフ":
-                # X軸として使用する列
-                x_column = st.selectbox(
-                    "X軸（時間軸）の列を選択",
-                    df.columns.tolist()
-                )
-                
-                # Y軸として使用する列
-                y_columns = st.multiselect(
-                    "Y軸の列を選択（複数選択可）",
-                    numeric_cols
-                )
-                
-                if x_column and y_columns:
-                    try:
-                        # X軸を日付型に変換してみる
-                        try:
-                            x_data = pd.to_datetime(df[x_column])
-                        except:
-                            x_data = df[x_column]
-                        
-                        fig = px.line(df, x=x_column, y=y_columns, title="時系列データ")
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "棒グラフ":
-                # X軸として使用する列
-                x_column = st.selectbox(
-                    "X軸（カテゴリ）の列を選択",
-                    df.columns.tolist()
-                )
-                
-                # Y軸として使用する列
-                y_column = st.selectbox(
-                    "Y軸（数値）の列を選択",
-                    numeric_cols if numeric_cols else ["なし"]
-                )
-                
-                if x_column and y_column != "なし":
-                    # カテゴリ数が多すぎる場合は上位N件に制限
-                    max_categories = st.slider("表示するカテゴリ数", 5, 30, 10)
-                    
-                    try:
-                        # 集計方法を選択
-                        agg_method = st.selectbox(
-                            "集計方法",
-                            ["合計", "平均", "中央値", "最大値", "最小値"]
-                        )
-                        
-                        # 集計方法に応じてデータを集計
-                        agg_func = {
-                            "合計": "sum",
-                            "平均": "mean",
-                            "中央値": "median",
-                            "最大値": "max",
-                            "最小値": "min"
-                        }[agg_method]
-                        
-                        # データを集計
-                        agg_data = df.groupby(x_column)[y_column].agg(agg_func).sort_values(ascending=False)
-                        
-                        # トップNのカテゴリを選択
-                        agg_data = agg_data.head(max_categories)
-                        
-                        fig = px.bar(
-                            x=agg_data.index, 
-                            y=agg_data.values,
-                            title=f"{x_column}ごとの{y_column}の{agg_method}"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "散布図":
-                # X軸として使用する列
-                x_column = st.selectbox(
-                    "X軸の列を選択",
-                    numeric_cols if numeric_cols else ["なし"]
-                )
-                
-                # Y軸として使用する列
-                y_column = st.selectbox(
-                    "Y軸の列を選択",
-                    numeric_cols if numeric_cols else ["なし"],
-                    index=min(1, len(numeric_cols)-1) if len(numeric_cols) > 1 else 0
-                )
-                
-                # 色分け用の列（オプション）
-                color_column = st.selectbox(
-                    "色分け用の列（オプション）",
-                    ["なし"] + df.columns.tolist()
-                )
-                
-                color_column = None if color_column == "なし" else color_column
-                
-                if x_column != "なし" and y_column != "なし":
-                    try:
-                        fig = px.scatter(
-                            df, 
-                            x=x_column, 
-                            y=y_column, 
-                            color=color_column,
-                            title=f"{x_column} vs {y_column}"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # 相関係数の表示
-                        correlation = df[x_column].corr(df[y_column])
-                        st.metric("相関係数", f"{correlation:.4f}")
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "ヒストグラム":
-                # 列を選択
-                column = st.selectbox(
-                    "列を選択",
-                    numeric_cols if numeric_cols else ["なし"]
-                )
-                
-                if column != "なし":
-                    try:
-                        # ビンの数を設定
-                        bin_count = st.slider("ビン（区間）の数", 5, 100, 20)
-                        
-                        # 正規化するかどうか
-                        normalize = st.checkbox("確率密度に正規化", value=False)
-                        
-                        # ヒストグラムを描画
-                        fig = px.histogram(
-                            df, x=column, 
-                            nbins=bin_count, 
-                            title=f"{column}のヒストグラム",
-                            histnorm='probability density' if normalize else None,
-                            marginal="box"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # 基本統計量
-                        stats = df[column].describe()
-                        st.write(f"平均値: {stats['mean']:.2f}, 標準偏差: {stats['std']:.2f}")
-                        st.write(f"最小値: {stats['min']:.2f}, 最大値: {stats['max']:.2f}")
-                        st.write(f"第1四分位数: {stats['25%']:.2f}, 中央値: {stats['50%']:.2f}, 第3四分位数: {stats['75%']:.2f}")
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "箱ひげ図":
-                # Y軸として使用する列
-                y_column = st.selectbox(
-                    "数値列を選択",
-                    numeric_cols if numeric_cols else ["なし"]
-                )
-                
-                # グループ化の列（オプション）
-                x_column = st.selectbox(
-                    "グループ化する列（オプション）",
-                    ["なし"] + df.columns.tolist()
-                )
-                
-                x_column = None if x_column == "なし" else x_column
-                
-                if y_column != "なし":
-                    try:
-                        if x_column:
-                            # カテゴリ数が多すぎる場合は上位N件に制限
-                            categories = df[x_column].value_counts().index
-                            max_categories = st.slider("表示するカテゴリ数", 2, 30, min(10, len(categories)))
-                            top_categories = categories[:max_categories]
-                            
-                            boxplot_data = df[df[x_column].isin(top_categories)]
-                        else:
-                            boxplot_data = df
-                        
-                        fig = px.box(
-                            boxplot_data, 
-                            x=x_column, 
-                            y=y_column,
-                            title=f"{y_column}の分布" + (f"（{x_column}ごと）" if x_column else "")
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "パイチャート":
-                # カテゴリ列を選択
-                column = st.selectbox(
-                    "カテゴリ列を選択",
-                    df.columns.tolist()
-                )
-                
-                if column:
-                    try:
-                        # カテゴリ数が多すぎる場合は上位N件に制限し、残りは「その他」にまとめる
-                        max_categories = st.slider("表示するカテゴリ数", 2, 20, 5)
-                        
-                        # カテゴリごとの集計
-                        counts = df[column].value_counts()
-                        
-                        # トップNとその他に分類
-                        if len(counts) > max_categories:
-                            top_counts = counts.iloc[:max_categories]
-                            other_count = counts.iloc[max_categories:].sum()
-                            
-                            labels = list(top_counts.index) + ['その他']
-                            values = list(top_counts.values) + [other_count]
-                        else:
-                            labels = counts.index
-                            values = counts.values
-                        
-                        fig = px.pie(
-                            names=labels, 
-                            values=values,
-                            title=f"{column}の分布"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
-            
-            elif chart_type == "ヒートマップ":
-                if len(numeric_cols) < 2:
-                    st.warning("ヒートマップを作成するには、少なくとも2つの数値列が必要です。")
-                else:
-                    try:
-                        # 相関行列の計算
-                        corr_matrix = df[numeric_cols].corr()
-                        
-                        # ヒートマップの作成
-                        fig = px.imshow(
-                            corr_matrix,
-                            text_auto=True,
-                            aspect="auto",
-                            color_continuous_scale='RdBu_r',
-                            title="相関係数ヒートマップ"
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"グラフの作成に失敗しました: {e}")
+            _render_visualization_tab(df, numeric_cols)
         
         # 相関分析タブ
         with explore_tabs[3]:
@@ -628,7 +1042,7 @@ elif app_mode == "データ探索":
                 st.warning("相関分析を行うには、少なくとも2つの数値列が必要です。")
             else:
                 # 相関分析を実行
-                corr_results = perform_correlation_analysis(df, numeric_cols)
+                corr_results = perform_correlation_analysis(df[numeric_cols], numeric_cols)
                 
                 # 相関行列ヒートマップの表示
                 st.subheader("相関係数ヒートマップ")
@@ -682,11 +1096,18 @@ elif app_mode == "データ前処理":
                 # 列の名前変更
                 st.subheader("列名の変更（オプション）")
                 
-                rename_columns = {}
-                for col in selected_columns:
-                    new_name = st.text_input(f"{col} の新しい名前", value=col)
-                    if new_name != col:
-                        rename_columns[col] = new_name
+                # 1つの表で全列の新しい名前を編集する
+                rename_table = st.data_editor(
+                    pd.DataFrame({'元の列名': selected_columns, '新しい列名': selected_columns}),
+                    num_rows='fixed',
+                    disabled=['元の列名'],
+                    hide_index=True
+                )
+                rename_columns = {
+                    col: new_name
+                    for col, new_name in zip(rename_table['元の列名'], rename_table['新しい列名'])
+                    if new_name and new_name != col
+                }
                 
                 if rename_columns:
                     processed_df = processed_df.rename(columns=rename_columns)
@@ -705,9 +1126,10 @@ elif app_mode == "データ前処理":
             st.subheader("欠損値の処理")
             
             # 各列の欠損値情報
+            null_counts = processed_df.isnull().sum()
             missing_info = pd.DataFrame({
-                '欠損値数': processed_df.isnull().sum(),
-                '欠損率(%)': (processed_df.isnull().sum() / len(processed_df) * 100).round(2)
+                '欠損値数': null_counts,
+                '欠損率(%)': (null_counts / len(processed_df) * 100).round(2)
             }).sort_values('欠損値数', ascending=False)
             
             st.dataframe(missing_info)
@@ -718,33 +1140,37 @@ elif app_mode == "データ前処理":
             if missing_columns:
                 st.subheader("欠損値処理方法の選択")
                 
-                handle_missing = {}
-                for col in missing_columns:
-                    method = st.selectbox(
-                        f"{col} の欠損値処理方法",
-                        ["処理しない", "削除", "平均値", "中央値", "最頻値", "ゼロ", "前の値で埋める", "後の値で埋める"],
-                        format_func=lambda x: {
-                            "処理しない": "処理しない",
-                            "削除": "行を削除",
-                            "平均値": "平均値で埋める",
-                            "中央値": "中央値で埋める",
-                            "最頻値": "最頻値で埋める",
-                            "ゼロ": "ゼロで埋める",
-                            "前の値で埋める": "前の値で埋める (前方補完)",
-                            "後の値で埋める": "後の値で埋める (後方補完)"
-                        }[x]
-                    )
-                    
-                    if method != "処理しない":
-                        handle_missing[col] = {
-                            "削除": "drop",
-                            "平均値": "mean",
-                            "中央値": "median",
-                            "最頻値": "mode",
-                            "ゼロ": "zero",
-                            "前の値で埋める": "forward",
-                            "後の値で埋める": "backward"
-                        }[method]
+                # 表示名と前処理設定の対応
+                missing_methods = {
+                    "処理しない": None,
+                    "行を削除": "drop",
+                    "平均値で埋める": "mean",
+                    "中央値で埋める": "median",
+                    "最頻値で埋める": "mode",
+                    "ゼロで埋める": "zero",
+                    "前の値で埋める (前方補完)": "forward",
+                    "後の値で埋める (後方補完)": "backward"
+                }
+                
+                # 全列の処理方法を1つの表で選択する
+                missing_spec = st.data_editor(
+                    pd.DataFrame({'列': missing_columns, '処理方法': "処理しない"}),
+                    column_config={
+                        '処理方法': st.column_config.SelectboxColumn(
+                            options=list(missing_methods),
+                            required=True
+                        )
+                    },
+                    disabled=['列'],
+                    num_rows='fixed',
+                    hide_index=True
+                )
+                
+                handle_missing = {
+                    col: missing_methods[method]
+                    for col, method in zip(missing_spec['列'], missing_spec['処理方法'])
+                    if missing_methods.get(method)
+                }
                 
                 # 処理の適用
                 if handle_missing and st.button("欠損値処理を適用"):
@@ -766,7 +1192,7 @@ elif app_mode == "データ前処理":
             st.subheader("外れ値の処理")
             
             # 数値列のみ処理
-            numeric_cols = processed_df.select_dtypes(include=np.number).columns.tolist()
+            numeric_cols = _numeric_columns(processed_df)[0]
             
             if numeric_cols:
                 # 外れ値を可視化
@@ -778,45 +1204,59 @@ elif app_mode == "データ前処理":
                     numeric_cols
                 )
                 
+                # 全数値列のIQRしきい値と外れ値数を一括で計算
+                outlier_stats = _iqr_outlier_stats(processed_df[numeric_cols])
+                
                 if viz_column:
                     # 箱ひげ図で外れ値を確認
                     fig = px.box(processed_df, y=viz_column, title=f"{viz_column}の箱ひげ図")
                     st.plotly_chart(fig, use_container_width=True)
                     
-                    # IQRによる外れ値検出
-                    Q1 = processed_df[viz_column].quantile(0.25)
-                    Q3 = processed_df[viz_column].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    
-                    outliers = processed_df[(processed_df[viz_column] < lower_bound) | 
-                                            (processed_df[viz_column] > upper_bound)][viz_column]
+                    # IQRによる外れ値検出の結果
+                    lower_bound = outlier_stats.at[viz_column, '下限しきい値']
+                    upper_bound = outlier_stats.at[viz_column, '上限しきい値']
+                    n_outliers = outlier_stats.at[viz_column, '外れ値の数']
                     
                     # 外れ値の情報を表示
-                    st.write(f"**外れ値の統計:**")
+                    st.write("**外れ値の統計:**")
                     st.write(f"- 下限しきい値: {lower_bound:.2f}")
                     st.write(f"- 上限しきい値: {upper_bound:.2f}")
-                    st.write(f"- 外れ値の数: {len(outliers)}")
-                    st.write(f"- 全体に対する割合: {len(outliers) / len(processed_df) * 100:.2f}%")
+                    st.write(f"- 外れ値の数: {n_outliers}")
+                    st.write(f"- 全体に対する割合: {n_outliers / len(processed_df) * 100:.2f}%")
                 
                 # 外れ値処理方法の選択
                 st.subheader("外れ値処理方法の選択")
                 
-                handle_outliers = {}
-                for col in numeric_cols:
-                    method = st.selectbox(
-                        f"{col} の外れ値処理方法",
-                        ["処理しない", "クリッピング", "削除"],
-                        format_func=lambda x: {
-                            "処理しない": "処理しない",
-                            "クリッピング": "クリッピング（しきい値に置換）",
-                            "削除": "外れ値を含む行を削除"
-                        }[x]
-                    )
-                    
-                    if method != "処理しない":
-                        handle_outliers[col] = "clip" if method == "クリッピング" else "remove"
+                # 表示名と前処理設定の対応
+                outlier_methods = {
+                    "処理しない": None,
+                    "クリッピング（しきい値に置換）": "clip",
+                    "外れ値を含む行を削除": "remove"
+                }
+                
+                # 全列の外れ値統計と処理方法を1つの表で表示・選択する
+                outlier_spec = outlier_stats.rename_axis('列').reset_index()
+                outlier_spec['処理方法'] = "処理しない"
+                outlier_spec = st.data_editor(
+                    outlier_spec,
+                    column_config={
+                        '下限しきい値': st.column_config.NumberColumn(format="%.2f"),
+                        '上限しきい値': st.column_config.NumberColumn(format="%.2f"),
+                        '処理方法': st.column_config.SelectboxColumn(
+                            options=list(outlier_methods),
+                            required=True
+                        )
+                    },
+                    disabled=['列', '下限しきい値', '上限しきい値', '外れ値の数'],
+                    num_rows='fixed',
+                    hide_index=True
+                )
+                
+                handle_outliers = {
+                    col: outlier_methods[method]
+                    for col, method in zip(outlier_spec['列'], outlier_spec['処理方法'])
+                    if outlier_methods.get(method)
+                }
                 
                 # 処理の適用
                 if handle_outliers and st.button("外れ値処理を適用"):
@@ -838,7 +1278,7 @@ elif app_mode == "データ前処理":
             st.subheader("データのスケーリング")
             
             # 数値列のみ処理
-            numeric_cols = processed_df.select_dtypes(include=np.number).columns.tolist()
+            numeric_cols = _numeric_columns(processed_df)[0]
             
             if numeric_cols:
                 # スケーリング方法の選択
@@ -893,15 +1333,8 @@ elif app_mode == "データ前処理":
         with preprocess_tabs[4]:
             st.subheader("特徴量エンジニアリング")
             
-            # 日付列の処理
-            datetime_cols = []
-            for col in processed_df.columns:
-                try:
-                    # 日付型の列または日付に変換可能な列を検出
-                    if pd.api.types.is_datetime64_any_dtype(processed_df[col]) or pd.to_datetime(processed_df[col], errors='coerce').notna().all():
-                        datetime_cols.append(col)
-                except:
-                    pass
+            # 日付列の処理（日付型の列または日付に変換可能な列を検出）
+            datetime_cols = _detect_datetime_columns(processed_df)
             
             if datetime_cols:
                 st.subheader("日付特徴量の抽出")
@@ -956,7 +1389,7 @@ elif app_mode == "データ前処理":
                 st.info("日付型の列が見つかりませんでした。")
             
             # 数値列のビン分割
-            numeric_cols = processed_df.select_dtypes(include=np.number).columns.tolist()
+            numeric_cols = _numeric_columns(processed_df)[0]
             
             if numeric_cols:
                 st.subheader("数値のビン分割")
@@ -1008,18 +1441,20 @@ elif app_mode == "データ前処理":
             
             # 元のデータと前処理後のデータを比較
             st.write("**元のデータと前処理後のデータの比較:**")
+            st.write(f"元のデータ: {original_df.shape[0]} 行 × {original_df.shape[1]} 列 → "
+                     f"前処理後のデータ: {processed_df.shape[0]} 行 × {processed_df.shape[1]} 列")
             
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.write("**元のデータ:**")
-                st.dataframe(original_df.head(5))
-                st.write(f"行数: {original_df.shape[0]}, 列数: {original_df.shape[1]}")
-            
-            with col2:
-                st.write("**前処理後のデータ:**")
-                st.dataframe(processed_df.head(5))
-                st.write(f"行数: {processed_df.shape[0]}, 列数: {processed_df.shape[1]}")
+            # タブは非表示でも毎回描画されるため、データのプレビューは表示を選んだ場合のみ送信する
+            if st.toggle("データのプレビューを表示", value=False):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write("**元のデータ:**")
+                    st.dataframe(original_df.head(5))
+                
+                with col2:
+                    st.write("**前処理後のデータ:**")
+                    st.dataframe(processed_df.head(5))
             
             # 前処理設定の表示
             st.subheader("適用された前処理:")
@@ -1033,7 +1468,7 @@ elif app_mode == "データ前処理":
             
             # 前処理のリセット
             if st.button("前処理をリセット"):
-                st.session_state.processed_data = st.session_state.data.copy()
+                st.session_state.processed_data = st.session_state.data
                 st.session_state.preprocessing_config = {}
                 st.success("前処理をリセットしました。元のデータに戻りました。")
 
@@ -1059,15 +1494,8 @@ elif app_mode == "高度な分析":
         if analysis_type == "時系列分析":
             st.subheader("時系列分析")
             
-            # 日付列の検出
-            datetime_cols = []
-            for col in df.columns:
-                try:
-                    # 日付型の列または日付に変換可能な列を検出
-                    if pd.api.types.is_datetime64_any_dtype(df[col]) or pd.to_datetime(df[col], errors='coerce').notna().all():
-                        datetime_cols.append(col)
-                except:
-                    pass
+            # 日付列の検出（日付型の列または日付に変換可能な列）
+            datetime_cols = _detect_datetime_columns(df)
             
             if not datetime_cols:
                 st.warning("日付列が見つかりません。時系列分析を行うには、日付列が必要です。")
@@ -1079,7 +1507,7 @@ elif app_mode == "高度な分析":
                 )
                 
                 # 分析対象の数値列を選択
-                numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+                numeric_cols = _numeric_columns(df)[0]
                 
                 if not numeric_cols:
                     st.warning("数値列が見つかりません。時系列分析を行うには、数値列が必要です。")
@@ -1092,12 +1520,15 @@ elif app_mode == "高度な分析":
                     # 時系列分析の実行
                     if st.button("時系列分析を実行"):
                         with st.spinner("分析を実行中..."):
-                            # 日付列が日付型でない場合は変換
-                            if not pd.api.types.is_datetime64_any_dtype(df[date_column]):
-                                df[date_column] = pd.to_datetime(df[date_column])
+                            ts_df = df[[date_column, value_column]]
+                            
+                            # 日付列が日付型でない場合は変換（同じ文字列の解析結果は再利用し、変換できない行は除外）
+                            if not pd.api.types.is_datetime64_any_dtype(ts_df[date_column]):
+                                ts_df[date_column] = _parse_datetime_column(ts_df[date_column])
+                                ts_df = ts_df.dropna(subset=[date_column])
                             
                             # 時系列分析の実行
-                            ts_results = perform_time_series_analysis(df, date_column, value_column)
+                            ts_results = perform_time_series_analysis(ts_df, date_column, value_column)
                             
                             # 結果を保存
                             st.session_state.analysis_results['time_series'] = ts_results
@@ -1123,9 +1554,11 @@ elif app_mode == "高度な分析":
                             
                             col1, col2 = st.columns(2)
                             with col1:
-                                st.image(ts_results['acf_plot'], caption="自己相関関数 (ACF)")
+                                st.plotly_chart(ts_results['acf_plot'], use_container_width=True)
+                                st.caption("自己相関関数 (ACF)")
                             with col2:
-                                st.image(ts_results['pacf_plot'], caption="偏自己相関関数 (PACF)")
+                                st.plotly_chart(ts_results['pacf_plot'], use_container_width=True)
+                                st.caption("偏自己相関関数 (PACF)")
                         
                         # エラーの表示（ある場合）
                         if 'error' in ts_results:
@@ -1136,7 +1569,7 @@ elif app_mode == "高度な分析":
             st.subheader("クラスター分析")
             
             # 数値列の選択
-            numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+            numeric_cols = _numeric_columns(df)[0]
             
             if len(numeric_cols) < 2:
                 st.warning("クラスター分析を行うには、少なくとも2つの数値列が必要です。")
@@ -1160,8 +1593,9 @@ elif app_mode == "高度な分析":
                             # クラスター分析の実行
                             cluster_results = perform_cluster_analysis(df, selected_columns, n_clusters)
                             
-                            # 結果を保存
+                            # 結果を保存（前回の結果から作成したCSVは破棄）
                             st.session_state.analysis_results['cluster'] = cluster_results
+                            st.session_state.pop('clustering_csv_bytes', None)
                             
                             st.success("分析が完了しました。")
                     
@@ -1195,14 +1629,17 @@ elif app_mode == "高度な分析":
                             st.subheader("クラスタリング結果のダウンロード")
                             df_with_clusters = cluster_results['df_with_clusters']
                             
-                            # CSVとしてダウンロード
-                            csv = df_with_clusters.to_csv(index=False)
-                            st.download_button(
-                                label="クラスタリング結果をCSVでダウンロード",
-                                data=csv,
-                                file_name="clustering_results.csv",
-                                mime="text/csv"
-                            )
+                            # CSVは毎回の再実行では作らず、ボタンが押されたときだけ作成する
+                            if st.button("CSVを準備"):
+                                st.session_state.clustering_csv_bytes = _csv_bytes(df_with_clusters)
+                            
+                            if 'clustering_csv_bytes' in st.session_state:
+                                st.download_button(
+                                    label="クラスタリング結果をCSVでダウンロード",
+                                    data=st.session_state.clustering_csv_bytes,
+                                    file_name="clustering_results.csv",
+                                    mime="text/csv"
+                                )
         
         # 分布分析
         elif analysis_type == "分布分析":
@@ -1219,7 +1656,7 @@ elif app_mode == "高度な分析":
                 if st.button("分布分析を実行"):
                     with st.spinner("分析を実行中..."):
                         # 分布分析の実行
-                        dist_results = perform_distribution_analysis(df, column)
+                        dist_results = perform_distribution_analysis(df[[column]], column)
                         
                         # 結果を保存
                         st.session_state.analysis_results['distribution'] = dist_results
@@ -1272,7 +1709,7 @@ elif app_mode == "高度な分析":
                         # QQプロットの表示
                         if 'qq_plot' in dist_results:
                             st.subheader("QQプロット (正規性の視覚的確認)")
-                            st.image(dist_results['qq_plot'])
+                            st.plotly_chart(dist_results['qq_plot'], use_container_width=True)
                             st.write("直線上に点が並んでいれば正規分布に近い。")
                     
                     # カテゴリ列の場合
@@ -1284,11 +1721,7 @@ elif app_mode == "高度な分析":
                         # 頻度の表示
                         if 'value_counts' in dist_results:
                             st.subheader("出現頻度")
-                            st.dataframe(pd.DataFrame({
-                                '値': dist_results['value_counts'].index,
-                                '頻度': dist_results['value_counts'].values,
-                                '割合 (%)': (dist_results['value_counts'].values / dist_results['value_counts'].sum() * 100).round(2)
-                            }))
+                            st.dataframe(_value_counts_table(dist_results))
 
 # --------------------------------
 # レポート生成機能
@@ -1318,215 +1751,228 @@ elif app_mode == "レポート生成":
             include_preprocessing = st.checkbox("前処理情報を含める", value=True)
             include_advanced_analysis = st.checkbox("高度な分析結果を含める", value=True)
             include_conclusion = st.checkbox("自動生成された結論を含める", value=True)
+            measure_deep_memory = st.checkbox("メモリ使用量を文字列の中身まで正確に計測する", value=False)
         
         # レポート生成ボタン
         if st.button("レポート生成"):
             st.subheader("生成されたレポート")
             
-            # レポートの内容を構築
-            report_content = f"# {report_title}\n\n"
-            report_content += f"**生成日時:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+            # レポートの内容を構築（文字列の連結を繰り返さず、バッファに順に書き込む）
+            buffer = io.StringIO()
+            w = buffer.write
+            w(f"# {report_title}\n\n")
+            w(f"**生成日時:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            
+            # 欠損値の真偽値配列を1回だけ作り、列ごとの欠損値数と総数を求める（以降の集計で共有）
+            null_mask = df.isna().to_numpy()
+            null_counts = pd.Series(null_mask.sum(axis=0), index=df.columns)
+            total_nulls = int(null_counts.sum())
             
             # データ概要
-            report_content += "## 1. データ概要\n\n"
-            report_content += f"* 行数: {df.shape[0]}\n"
-            report_content += f"* 列数: {df.shape[1]}\n"
-            report_content += f"* メモリ使用量: {df.memory_usage(deep=True).sum() / 1024:.2f} KB\n"
-            report_content += f"* 欠損値の数: {df.isnull().sum().sum()}\n\n"
+            w("## 1. データ概要\n\n")
+            w(f"* 行数: {df.shape[0]}\n")
+            w(f"* 列数: {df.shape[1]}\n")
+            if measure_deep_memory:
+                w(f"* メモリ使用量: {_dataset_info(df)[2] / 1024:.2f} KB\n")
+            else:
+                # 文字列などのオブジェクトの中身は走査しない推定値
+                w(f"* メモリ使用量（推定）: {df.memory_usage(deep=False).sum() / 1024:.2f} KB\n")
+            w(f"* 欠損値の数: {total_nulls}\n\n")
             
             # データ型情報
-            report_content += "### 1.1 データ型情報\n\n"
+            w("### 1.1 データ型情報\n\n")
+            # 欠損値数から非欠損値数を求め、ユニーク値数は大きなデータでは先頭行で近似する
+            if len(df) > REPORT_NUNIQUE_SAMPLE_SIZE:
+                unique_label = f"ユニーク値数（先頭{REPORT_NUNIQUE_SAMPLE_SIZE}行での近似）"
+            else:
+                unique_label = 'ユニーク値数'
             dtype_info = pd.DataFrame({
                 'データ型': df.dtypes,
-                '非欠損値数': df.count(),
-                '欠損値数': df.isnull().sum(),
-                '欠損率(%)': (df.isnull().sum() / len(df) * 100).round(2),
-                'ユニーク値数': df.nunique()
+                '非欠損値数': len(df) - null_counts,
+                '欠損値数': null_counts,
+                '欠損率(%)': (null_counts / len(df) * 100).round(2),
+                unique_label: df.head(REPORT_NUNIQUE_SAMPLE_SIZE).nunique()
             })
-            report_content += dtype_info.to_markdown() + "\n\n"
+            w(_table_markdown(dtype_info) + "\n\n")
             
             # データプレビュー
             if include_data_preview:
-                report_content += "### 1.2 データプレビュー\n\n"
-                report_content += df.head().to_markdown() + "\n\n"
+                w("### 1.2 データプレビュー\n\n")
+                w(df.head().to_markdown() + "\n\n")
             
             # 基本統計量
             if include_basic_stats:
-                report_content += "## 2. 基本統計量\n\n"
+                w("## 2. 基本統計量\n\n")
                 
-                numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
+                numeric_cols, non_numeric_cols = _numeric_columns(df)
                 if numeric_cols:
-                    report_content += "### 2.1 数値列の統計量\n\n"
-                    report_content += df[numeric_cols].describe().T.to_markdown() + "\n\n"
+                    w("### 2.1 数値列の統計量\n\n")
+                    w(_table_markdown(_describe_numeric(df[numeric_cols])) + "\n\n")
                 
-                non_numeric_cols = df.select_dtypes(exclude=np.number).columns.tolist()
                 if non_numeric_cols:
-                    report_content += "### 2.2 非数値列の情報\n\n"
+                    w("### 2.2 非数値列の情報\n\n")
                     for col in non_numeric_cols:
-                        report_content += f"**{col}** のトップ値:\n\n"
+                        w(f"**{col}** のトップ値:\n\n")
                         try:
-                            report_content += df[col].value_counts().head(5).to_markdown() + "\n\n"
+                            w(_value_counts(df[col]).head(5).to_markdown() + "\n\n")
                         except:
-                            report_content += "この列の集計に失敗しました。\n\n"
+                            w("この列の集計に失敗しました。\n\n")
             
             # 前処理情報
             if include_preprocessing and st.session_state.preprocessing_config:
-                report_content += "## 3. 適用された前処理\n\n"
+                w("## 3. 適用された前処理\n\n")
                 
-                for process, config in st.session_state.preprocessing_config.items():
-                    report_content += f"### 3.{list(st.session_state.preprocessing_config.keys()).index(process) + 1} {process}\n\n"
-                    report_content += f"```json\n{str(config)}\n```\n\n"
+                for i, (process, config) in enumerate(st.session_state.preprocessing_config.items(), 1):
+                    w(f"### 3.{i} {process}\n\n")
+                    w(f"```json\n{str(config)}\n```\n\n")
                 
                 if original_df.shape != df.shape:
-                    report_content += "### 3.99 前処理の影響\n\n"
-                    report_content += f"* 元のデータ: {original_df.shape[0]} 行 × {original_df.shape[1]} 列\n"
-                    report_content += f"* 処理後のデータ: {df.shape[0]} 行 × {df.shape[1]} 列\n"
-                    report_content += f"* 変化: {df.shape[0] - original_df.shape[0]} 行, {df.shape[1] - original_df.shape[1]} 列\n\n"
+                    w("### 3.99 前処理の影響\n\n")
+                    w(f"* 元のデータ: {original_df.shape[0]} 行 × {original_df.shape[1]} 列\n")
+                    w(f"* 処理後のデータ: {df.shape[0]} 行 × {df.shape[1]} 列\n")
+                    w(f"* 変化: {df.shape[0] - original_df.shape[0]} 行, {df.shape[1] - original_df.shape[1]} 列\n\n")
+            
+            # 分析結果はセッション状態から1回だけ取り出して以降はローカル変数で参照する
+            analysis_results = st.session_state.analysis_results or {}
+            ts_results = analysis_results.get('time_series')
+            cluster_results = analysis_results.get('cluster')
+            dist_results = analysis_results.get('distribution')
             
             # 高度な分析結果
-            if include_advanced_analysis and st.session_state.analysis_results:
-                report_content += "## 4. 高度な分析結果\n\n"
+            if include_advanced_analysis and analysis_results:
+                w("## 4. 高度な分析結果\n\n")
                 
                 # 時系列分析結果
-                if 'time_series' in st.session_state.analysis_results:
-                    report_content += "### 4.1 時系列分析\n\n"
-                    report_content += "時系列分析では、データの時間的パターン、トレンド、季節性、周期性などを調査しました。\n\n"
+                if ts_results is not None:
+                    w("### 4.1 時系列分析\n\n")
+                    w("時系列分析では、データの時間的パターン、トレンド、季節性、周期性などを調査しました。\n\n")
                     
-                    if 'error' in st.session_state.analysis_results['time_series']:
-                        report_content += f"**注意:** 分析中にエラーが発生しました: {st.session_state.analysis_results['time_series']['error']}\n\n"
+                    if 'error' in ts_results:
+                        w(f"**注意:** 分析中にエラーが発生しました: {ts_results['error']}\n\n")
                     else:
-                        report_content += "分析の詳細はダッシュボードの「高度な分析」タブで確認できます。\n\n"
+                        w("分析の詳細はダッシュボードの「高度な分析」タブで確認できます。\n\n")
                 
                 # クラスター分析結果
-                if 'cluster' in st.session_state.analysis_results:
-                    report_content += "### 4.2 クラスター分析\n\n"
-                    report_content += "クラスター分析では、データポイントを類似性に基づいてグループ化しました。\n\n"
-                    
-                    cluster_results = st.session_state.analysis_results['cluster']
+                if cluster_results is not None:
+                    w("### 4.2 クラスター分析\n\n")
+                    w("クラスター分析では、データポイントを類似性に基づいてグループ化しました。\n\n")
                     
                     if 'cluster_stats' in cluster_results:
-                        report_content += "**クラスターごとの統計量:**\n\n"
-                        report_content += "クラスターごとの基本統計量は、ダッシュボードの「高度な分析」タブで確認できます。\n\n"
+                        w("**クラスターごとの統計量:**\n\n")
+                        w("クラスターごとの基本統計量は、ダッシュボードの「高度な分析」タブで確認できます。\n\n")
                     
                     if 'explained_variance' in cluster_results:
-                        report_content += "**主成分分析 (PCA):**\n\n"
-                        report_content += f"第1主成分の説明率: {cluster_results['explained_variance'][0]:.2f}\n"
-                        report_content += f"第2主成分の説明率: {cluster_results['explained_variance'][1]:.2f}\n"
-                        report_content += f"合計説明率: {sum(cluster_results['explained_variance'][:2]):.2f}\n\n"
+                        w("**主成分分析 (PCA):**\n\n")
+                        w(f"第1主成分の説明率: {cluster_results['explained_variance'][0]:.2f}\n")
+                        w(f"第2主成分の説明率: {cluster_results['explained_variance'][1]:.2f}\n")
+                        w(f"合計説明率: {sum(cluster_results['explained_variance'][:2]):.2f}\n\n")
                 
                 # 分布分析結果
-                if 'distribution' in st.session_state.analysis_results:
-                    report_content += "### 4.3 分布分析\n\n"
-                    dist_results = st.session_state.analysis_results['distribution']
+                if dist_results is not None:
+                    w("### 4.3 分布分析\n\n")
                     
                     if 'stats' in dist_results:
-                        report_content += "**数値変数の分布分析:**\n\n"
-                        report_content += dist_results['stats'].to_markdown() + "\n\n"
+                        w("**数値変数の分布分析:**\n\n")
+                        w(dist_results['stats'].to_markdown() + "\n\n")
                         
                         if 'skewness' in dist_results and 'kurtosis' in dist_results:
-                            report_content += f"* 歪度 (Skewness): {dist_results['skewness']:.4f}\n"
-                            report_content += f"* 尖度 (Kurtosis): {dist_results['kurtosis']:.4f}\n\n"
+                            w(f"* 歪度 (Skewness): {dist_results['skewness']:.4f}\n")
+                            w(f"* 尖度 (Kurtosis): {dist_results['kurtosis']:.4f}\n\n")
                         
                         if 'shapiro_test' in dist_results or 'normaltest' in dist_results:
-                            report_content += "**正規性検定:**\n\n"
+                            w("**正規性検定:**\n\n")
                             
                             if 'shapiro_test' in dist_results:
                                 p_value = dist_results['shapiro_test']['p-value']
-                                report_content += f"* Shapiro-Wilk検定: p値 = {p_value:.4f}"
-                                report_content += f" ({p_value < 0.05 and '正規分布ではない可能性が高い' or '正規分布の可能性がある'})\n"
+                                w(f"* Shapiro-Wilk検定: p値 = {p_value:.4f}")
+                                w(f" ({p_value < 0.05 and '正規分布ではない可能性が高い' or '正規分布の可能性がある'})\n")
                             
                             if 'normaltest' in dist_results:
                                 p_value = dist_results['normaltest']['p-value']
-                                report_content += f"* D'Agostino's K^2検定: p値 = {p_value:.4f}"
-                                report_content += f" ({p_value < 0.05 and '正規分布ではない可能性が高い' or '正規分布の可能性がある'})\n\n"
+                                w(f"* D'Agostino's K^2検定: p値 = {p_value:.4f}")
+                                w(f" ({p_value < 0.05 and '正規分布ではない可能性が高い' or '正規分布の可能性がある'})\n\n")
                     
                     elif 'value_counts' in dist_results:
-                        report_content += "**カテゴリ変数の分布分析:**\n\n"
-                        value_counts = dist_results['value_counts']
-                        value_counts_df = pd.DataFrame({
-                            '値': value_counts.index,
-                            '頻度': value_counts.values,
-                            '割合 (%)': (value_counts.values / value_counts.sum() * 100).round(2)
-                        })
-                        report_content += value_counts_df.to_markdown() + "\n\n"
+                        w("**カテゴリ変数の分布分析:**\n\n")
+                        w(_value_counts_markdown(dist_results) + "\n\n")
             
             # 自動生成された結論
             if include_conclusion:
-                report_content += "## 5. 結論と洞察\n\n"
+                w("## 5. 結論と洞察\n\n")
                 
                 # データの基本情報に基づく結論
-                report_content += "### 5.1 データの概要\n\n"
+                w("### 5.1 データの概要\n\n")
                 
                 # 欠損値に関する結論
-                missing_ratio = df.isnull().sum().sum() / (df.shape[0] * df.shape[1]) * 100
+                missing_ratio = total_nulls / (df.shape[0] * df.shape[1]) * 100
                 if missing_ratio > 20:
-                    report_content += f"* データセットには欠損値が多く（全体の約{missing_ratio:.1f}%）、分析結果の信頼性に影響する可能性があります。\n"
+                    w(f"* データセットには欠損値が多く（全体の約{missing_ratio:.1f}%）、分析結果の信頼性に影響する可能性があります。\n")
                 elif missing_ratio > 0:
-                    report_content += f"* データセットには一部欠損値（全体の約{missing_ratio:.1f}%）が存在しますが、適切に処理されています。\n"
+                    w(f"* データセットには一部欠損値（全体の約{missing_ratio:.1f}%）が存在しますが、適切に処理されています。\n")
                 else:
-                    report_content += "* データセットに欠損値はなく、完全なデータで分析が行われています。\n"
+                    w("* データセットに欠損値はなく、完全なデータで分析が行われています。\n")
                 
                 # 高度な分析に基づく結論
-                if st.session_state.analysis_results:
-                    report_content += "### 5.2 分析結果からの洞察\n\n"
+                if analysis_results:
+                    w("### 5.2 分析結果からの洞察\n\n")
                     
                     # 時系列分析からの洞察
-                    if 'time_series' in st.session_state.analysis_results:
-                        report_content += "**時系列分析:**\n\n"
-                        report_content += "* 時系列データの詳細なパターンやトレンドは、ダッシュボードのグラフで視覚的に確認できます。\n"
-                        if 'decomposition_plot' in st.session_state.analysis_results['time_series']:
-                            report_content += "* データは季節性の要素とトレンド成分に分解され、時間的パターンの理解が深まりました。\n"
+                    if ts_results is not None:
+                        w("**時系列分析:**\n\n")
+                        w("* 時系列データの詳細なパターンやトレンドは、ダッシュボードのグラフで視覚的に確認できます。\n")
+                        if 'decomposition_plot' in ts_results:
+                            w("* データは季節性の要素とトレンド成分に分解され、時間的パターンの理解が深まりました。\n")
                     
                     # クラスター分析からの洞察
-                    if 'cluster' in st.session_state.analysis_results:
-                        report_content += "**クラスター分析:**\n\n"
-                        cluster_results = st.session_state.analysis_results['cluster']
+                    if cluster_results is not None:
+                        w("**クラスター分析:**\n\n")
                         if 'df_with_clusters' in cluster_results:
                             n_clusters = len(cluster_results['df_with_clusters']['cluster'].unique())
-                            report_content += f"* データは{n_clusters}つの異なるクラスターに分類され、それぞれ特徴的なパターンが示されています。\n"
+                            w(f"* データは{n_clusters}つの異なるクラスターに分類され、それぞれ特徴的なパターンが示されています。\n")
                         if 'explained_variance' in cluster_results:
                             total_var = sum(cluster_results['explained_variance'][:2])
                             if total_var > 0.7:
-                                report_content += f"* 2つの主成分で元の変動の{total_var:.0%}を説明でき、データの次元削減に成功しています。\n"
+                                w(f"* 2つの主成分で元の変動の{total_var:.0%}を説明でき、データの次元削減に成功しています。\n")
                             else:
-                                report_content += f"* 2つの主成分では元の変動の{total_var:.0%}しか説明できず、データの複雑性が示唆されています。\n"
+                                w(f"* 2つの主成分では元の変動の{total_var:.0%}しか説明できず、データの複雑性が示唆されています。\n")
                     
                     # 分布分析からの洞察
-                    if 'distribution' in st.session_state.analysis_results:
-                        report_content += "**分布分析:**\n\n"
-                        dist_results = st.session_state.analysis_results['distribution']
+                    if dist_results is not None:
+                        w("**分布分析:**\n\n")
                         if 'skewness' in dist_results:
                             skew = dist_results['skewness']
                             if abs(skew) < 0.5:
-                                report_content += f"* 分析した変数はほぼ対称的な分布を示しています（歪度: {skew:.2f}）。\n"
+                                w(f"* 分析した変数はほぼ対称的な分布を示しています（歪度: {skew:.2f}）。\n")
                             elif skew > 0:
-                                report_content += f"* 分析した変数は右に裾が長い分布を示しています（歪度: {skew:.2f}）。\n"
+                                w(f"* 分析した変数は右に裾が長い分布を示しています（歪度: {skew:.2f}）。\n")
                             else:
-                                report_content += f"* 分析した変数は左に裾が長い分布を示しています（歪度: {skew:.2f}）。\n"
+                                w(f"* 分析した変数は左に裾が長い分布を示しています（歪度: {skew:.2f}）。\n")
                         
                         if 'normaltest' in dist_results:
                             p_value = dist_results['normaltest']['p-value']
                             if p_value < 0.05:
-                                report_content += "* 正規性検定の結果、データは正規分布に従っていない可能性が高いです。\n"
+                                w("* 正規性検定の結果、データは正規分布に従っていない可能性が高いです。\n")
                             else:
-                                report_content += "* 正規性検定の結果、データは正規分布に従っている可能性があります。\n"
+                                w("* 正規性検定の結果、データは正規分布に従っている可能性があります。\n")
                 
                 # 総括
-                report_content += "### 5.3 総括\n\n"
-                report_content += "このレポートでは、データの基本的な特性、前処理の影響、そして高度な分析結果を提示しました。\n"
-                report_content += "より詳細な分析や視覚化はダッシュボードで利用できます。\n\n"
-                report_content += "データから得られた主な洞察は以下の通りです：\n\n"
+                w("### 5.3 総括\n\n")
+                w("このレポートでは、データの基本的な特性、前処理の影響、そして高度な分析結果を提示しました。\n")
+                w("より詳細な分析や視覚化はダッシュボードで利用できます。\n\n")
+                w("データから得られた主な洞察は以下の通りです：\n\n")
                 
-                if 'time_series' in st.session_state.analysis_results:
-                    report_content += "* 時系列データは時間的パターンを示しており、予測モデルの構築に役立つ可能性があります。\n"
+                if ts_results is not None:
+                    w("* 時系列データは時間的パターンを示しており、予測モデルの構築に役立つ可能性があります。\n")
                 
-                if 'cluster' in st.session_state.analysis_results:
-                    report_content += "* データポイントはいくつかの明確なクラスターに分類でき、それぞれ特徴的な属性を持っています。\n"
+                if cluster_results is not None:
+                    w("* データポイントはいくつかの明確なクラスターに分類でき、それぞれ特徴的な属性を持っています。\n")
                 
-                if 'distribution' in st.session_state.analysis_results:
-                    report_content += "* 変数の分布特性を理解することで、異常値の検出や適切な統計モデルの選択が可能になります。\n"
+                if dist_results is not None:
+                    w("* 変数の分布特性を理解することで、異常値の検出や適切な統計モデルの選択が可能になります。\n")
                 
-                report_content += "\n**注意**: このレポートは自動生成されたものです。詳細な解釈には専門家の判断が必要な場合があります。"
+                w("\n**注意**: このレポートは自動生成されたものです。詳細な解釈には専門家の判断が必要な場合があります。")
+            
+            report_content = buffer.getvalue()
             
             # レポートの表示
             st.markdown(report_content)
@@ -1,146 +1,407 @@
+import warnings
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, MinMaxScaler, RobustScaler
+import pyarrow as pa
+import pyarrow.compute as pc
 from sklearn.impute import SimpleImputer
 
+
+# onehotエンコーディングを疎な形式で行うカテゴリ数の下限（これより多い列が対象）
+SPARSE_ONEHOT_MIN_CATEGORIES = 32
+
+# 文字列の特徴量をArrowの計算カーネルで作成する最小行数の既定値（これより小さい列は pandas で処理する。
+# 設定の 'backend_threshold_rows' で変更できる）
+ARROW_TEXT_MIN_ROWS = 50_000
+
+
+def _copy_on_write_enabled():
+    """
+    Copy-on-Write が有効かどうかを返す（pandas 3以降は常に有効で、オプションの参照は非推奨）
+    """
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.options.mode.copy_on_write
+
+
+def _is_numeric_column(series):
+    """
+    数値列（NumPy型・Arrow型の整数と浮動小数点。真偽値は除く）かどうかを判定する
+    """
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _is_datetime_column(series):
+    """
+    日時型の列（NumPy型・タイムゾーン付き・Arrowのtimestamp型）かどうかを判定する
+    """
+    if isinstance(series.dtype, pd.ArrowDtype):
+        return pa.types.is_timestamp(series.dtype.pyarrow_dtype)
+    return pd.api.types.is_datetime64_any_dtype(series)
+
+
+def _scale_in_place(values, method):
+    """
+    列ごとのスケーリングを配列上でその場で行う（欠損値は無視して統計量を求め、欠損のまま残す）
+    
+    Parameters:
+    -----------
+    values : numpy.ndarray
+        (行数, 列数) の浮動小数点配列（この配列が書き換えられる）
+    method : str
+        'standard'（平均0・標準偏差1）、'minmax'（0〜1）、'robust'（中央値0・IQRで割る）
+    """
+    with warnings.catch_warnings():
+        # 全て欠損の列の統計量はNaNとする
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        if method == 'standard':
+            center = np.nanmean(values, axis=0)
+            scale = np.nanstd(values, axis=0)
+        elif method == 'minmax':
+            center = np.nanmin(values, axis=0)
+            scale = np.nanmax(values, axis=0) - center
+        else:
+            q1, center, q3 = np.nanpercentile(values, [25, 50, 75], axis=0)
+            scale = q3 - q1
+    
+    # 散らばりが0の列は中心を引くだけにする（scikit-learnのスケーラーと同じ扱い）
+    scale[scale == 0] = 1.0
+    np.subtract(values, center.astype(values.dtype), out=values)
+    np.divide(values, scale.astype(values.dtype), out=values)
+
+
+def _calendar_fields(series):
+    """
+    日時列から年・月・日・曜日・四半期を、エポックからの日数に対する整数演算でまとめて求める
+    
+    Parameters:
+    -----------
+    series : pandas.Series
+        日時型の列（Arrowのtimestamp型も可。タイムゾーン付きの場合はその地域の日時で計算する）
+    
+    Returns:
+    --------
+    dict
+        'year', 'month', 'day', 'weekday'（月曜=0）, 'quarter' をキーとするSeriesの辞書（欠損値はNaN）
+    """
+    if isinstance(series.dtype, pd.ArrowDtype):
+        # Arrowのtimestamp型はNumPyの日時型に変換してから計算する
+        tz = series.dtype.pyarrow_dtype.tz
+        series = series.astype(pd.DatetimeTZDtype('ns', tz) if tz else 'datetime64[ns]')
+    if getattr(series.dt, 'tz', None) is not None:
+        series = series.dt.tz_localize(None)
+    days = series.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    is_nat = series.isna().to_numpy()
+    
+    # 1970-01-01からの日数をグレゴリオ暦の年月日に変換する（Howard Hinnant の civil_from_days）
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    
+    fields = {
+        'year': year.astype(np.int16),
+        'month': month.astype(np.int8),
+        'day': day.astype(np.int8),
+        # 1970-01-01は木曜日（月曜=0で3）
+        'weekday': ((days + 3) % 7).astype(np.int8),
+        'quarter': ((month - 1) // 3 + 1).astype(np.int8),
+    }
+    calendar = {name: pd.Series(values, index=series.index) for name, values in fields.items()}
+    if is_nat.any():
+        calendar = {name: values.mask(is_nat) for name, values in calendar.items()}
+    return calendar
+
+
+def _text_features(series, text_features, col, min_arrow_rows=ARROW_TEXT_MIN_ROWS):
+    """
+    文字列の列から長さ・単語数・指定文字列を含むかどうかの特徴量を作成する
+    
+    行数が min_arrow_rows 以上の列とArrow型の列はArrowの計算カーネルで処理し、
+    それ以外の小さい列は変換の固定コストを避けて pandas の .str で処理する
+    
+    Parameters:
+    -----------
+    series : pandas.Series
+        文字列の列
+    text_features : dict or list
+        作成する特徴量（'length', 'word_count', 'contains'。contains には検索する文字列のリストを指定する）
+    col : str
+        新しい列名の接頭辞にする列名
+    min_arrow_rows : int
+        Arrowの計算カーネルで処理する最小行数
+    
+    Returns:
+    --------
+    dict
+        新しい列名をキーとするSeriesの辞書
+    """
+    new_cols = {}
+    # Arrow型の列は変換の必要がなく、.str.split() の結果もリスト型になるため常にArrowで処理する
+    if len(series) < min_arrow_rows and not isinstance(series.dtype, pd.ArrowDtype):
+        if 'length' in text_features:
+            new_cols[f'{col}_length'] = series.str.len()
+        
+        if 'word_count' in text_features:
+            new_cols[f'{col}_word_count'] = series.str.split().str.len()
+        
+        if 'contains' in text_features:
+            for item in text_features['contains']:
+                new_cols[f'{col}_contains_{item}'] = series.str.contains(item, case=False, na=False).astype('int8')
+        return new_cols
+    
+    arr = pa.array(series, type=pa.string(), from_pandas=True)
+    if 'length' in text_features:
+        new_cols[f'{col}_length'] = pc.utf8_length(arr).to_pandas().set_axis(series.index)
+    
+    if 'word_count' in text_features:
+        # 前後の空白を除いてから空白の連続で分割する（str.split() と同じく空文字列は0語）
+        trimmed = pc.utf8_trim_whitespace(arr)
+        word_count = pc.list_value_length(pc.utf8_split_whitespace(trimmed))
+        word_count = pc.if_else(pc.equal(trimmed, ''), pa.scalar(0, word_count.type), word_count)
+        new_cols[f'{col}_word_count'] = word_count.to_pandas().set_axis(series.index)
+    
+    if 'contains' in text_features:
+        for item in text_features['contains']:
+            matched = pc.fill_null(pc.match_substring_regex(arr, pattern=item, ignore_case=True), False)
+            new_cols[f'{col}_contains_{item}'] = pc.cast(matched, pa.int8()).to_pandas().set_axis(series.index)
+    return new_cols
+
+
 def preprocess_data(df, config):
     """
     データ前処理を行う関数
     
     Parameters:
     -----------
-    df : pandas.DataFrame
-        前処理するデータフレーム
+    df : pandas.DataFrame or pyarrow.Table
+        前処理するデータ（Arrowのテーブルはバッファを共有したままArrow型の列として扱う）
     config : dict
         前処理の設定
     
     Returns:
     --------
-    pandas.DataFrame
-        前処理後のデータフレーム
+    pandas.DataFrame or pyarrow.Table
+        前処理後のデータ（入力と同じ形式）
     """
+    if isinstance(df, pa.Table):
+        processed_df = _preprocess_dataframe(df.to_pandas(types_mapper=pd.ArrowDtype), config)
+        
+        # Arrowは疎な列を扱えないため、疎な形式のダミー列は密な形式に戻してから変換する
+        sparse_dtypes = {
+            col: dtype.subtype for col, dtype in processed_df.dtypes.items()
+            if isinstance(dtype, pd.SparseDtype)
+        }
+        if sparse_dtypes:
+            processed_df = processed_df.astype(sparse_dtypes)
+        return pa.Table.from_pandas(processed_df, preserve_index=False)
     
-    processed_df = df.copy()
+    return _preprocess_dataframe(df, config)
+
+
+def _preprocess_dataframe(df, config):
+    """
+    データフレームに対して設定された前処理を順に行う
+    """
+    
+    # Copy-on-Write が有効な場合は浅いコピーで十分（変更した列だけが新しく確保される）
+    processed_df = df.copy(deep=not _copy_on_write_enabled())
+    
+    # 列の型を変更してメモリ転送量を減らす（'pyarrow': 全列をArrow型に、'float32': 数値列を単精度に変換）
+    if config.get('dtype_backend') == 'pyarrow':
+        # 整数値だけの浮動小数点列が整数型にならないよう、浮動小数点列は整数への変換を行わずに変換する
+        float_cols = [col for col in processed_df.columns if pd.api.types.is_float_dtype(processed_df[col])]
+        converted = processed_df.convert_dtypes(dtype_backend='pyarrow')
+        if float_cols:
+            converted[float_cols] = processed_df[float_cols].convert_dtypes(dtype_backend='pyarrow', convert_integer=False)
+        processed_df = converted
+    elif config.get('dtype_backend') == 'float32':
+        numeric_cols = [col for col in processed_df.columns if _is_numeric_column(processed_df[col])]
+        processed_df[numeric_cols] = processed_df[numeric_cols].astype(np.float32)
     
     if 'convert_types' in config and config['convert_types']:
-        for col in processed_df.columns:
+        for col, dtype in config['convert_types'].items():
+            if col not in processed_df.columns:
+                continue
             try:
                 if dtype == 'datetime':
                     processed_df[col] = pd.to_datetime(processed_df[col])
                 else:
                     processed_df[col] = processed_df[col].astype(dtype)
-            except Exception as e:
+            except (ValueError, TypeError) as e:
                 print(f"列 {col} の型変換に失敗しました: {e}")
                 
+    # 列の型の分類を1回だけ行い、以降の各処理で共有する
+    # （外れ値のクリップで整数列が浮動小数点型になるなど型が変わる処理はあるが、数値・日時・文字列の区別は変わらない）
+    numeric_cols = {col for col in processed_df.columns if _is_numeric_column(processed_df[col])}
+    datetime_cols = {col for col in processed_df.columns if _is_datetime_column(processed_df[col])}
+    # object型の列の文字列判定は全要素を走査するため、テキスト特徴量を作成する列だけを判定する
+    text_feature_cols = [
+        col for col, features in (config.get('feature_engineering') or {}).items()
+        if 'text_features' in features and col in processed_df.columns
+    ]
+    string_cols = {col for col in text_feature_cols if pd.api.types.is_string_dtype(processed_df[col])}
+    
     if 'handle_missing' in config and config['handle_missing']:
-        for col, method in config['handle_missing'].items():
-            if col in processed_df.columns and processed_df[col].isnull().any():
-                if method == 'drop':
-                    processed_df = processed_df.dropna(subset=[col])
-                elif method == 'mean':
-                    processed_df[col] = processed_df[col].fillna(processed_df[col].mean())
-                elif method == 'median':
-                    processed_df[col] = processed_df[col].fillna(processed_df[col]).median()
-                elif method == 'mode':
-                    processed_df[col] = processed_df[col].fillna(processed_df[col].mode()[0])
-                elif method == 'zero':
-                    processed.df[col] = processed.df[col].fillna(0)
-                elif method == 'forward':
-                    processed_df[col] = processed_df[col].fillna(method='ffill')
-                elif method == 'backward':
-                    processed_df[col] = processed_df[col].fillna(method='bfill')
+        # 対象列の欠損値数を1回の走査でまとめて求める
+        missing_targets = [col for col in config['handle_missing'] if col in processed_df.columns]
+        null_counts = processed_df[missing_targets].isnull().sum()
+        
+        # 対象列に欠損値が1つもなければ欠損値処理を丸ごと省略する
+        if null_counts.any():
+            # 欠損値のある列を処理方法ごとにまとめ、方法ごとに1回の呼び出しで処理する
+            cols_by_method = {}
+            for col in missing_targets:
+                if null_counts[col] > 0:
+                    cols_by_method.setdefault(config['handle_missing'][col], []).append(col)
+            
+            # 行の削除を先に行い、補完値は残った行から求める
+            if 'drop' in cols_by_method:
+                processed_df = processed_df.dropna(subset=cols_by_method['drop'])
+            
+            # 欠損値を持てる整数型（Arrow型・Int64など）の列は、平均値・中央値が整数に切り捨てられないよう浮動小数点型にする
+            float_dtypes = {}
+            for col in cols_by_method.get('mean', []) + cols_by_method.get('median', []):
+                dtype = processed_df[col].dtype
+                if pd.api.types.is_integer_dtype(dtype):
+                    float_dtypes[col] = pd.ArrowDtype(pa.float64()) if isinstance(dtype, pd.ArrowDtype) else 'Float64'
+            if float_dtypes:
+                processed_df = processed_df.astype(float_dtypes)
+            
+            fill_values = {}
+            if 'mean' in cols_by_method:
+                fill_values.update(processed_df[cols_by_method['mean']].mean())
+            if 'median' in cols_by_method:
+                fill_values.update(processed_df[cols_by_method['median']].median())
+            if 'mode' in cols_by_method:
+                fill_values.update(processed_df[cols_by_method['mode']].mode().iloc[0])
+            if 'zero' in cols_by_method:
+                # カテゴリ型の列は0をカテゴリに追加してから埋める（未登録の値は代入できないため）
+                for col in cols_by_method['zero']:
+                    if isinstance(processed_df[col].dtype, pd.CategoricalDtype) and 0 not in processed_df[col].cat.categories:
+                        processed_df[col] = processed_df[col].cat.add_categories(0)
+                fill_values.update(dict.fromkeys(cols_by_method['zero'], 0))
+            if fill_values:
+                processed_df = processed_df.fillna(fill_values)
+            
+            if 'forward' in cols_by_method:
+                processed_df[cols_by_method['forward']] = processed_df[cols_by_method['forward']].ffill()
+            if 'backward' in cols_by_method:
+                processed_df[cols_by_method['backward']] = processed_df[cols_by_method['backward']].bfill()
                     
     if 'handle_outliers' in config and config['handle_outliers']:
-        for col, method in config['handle_outliers'].items():
-            if col in processed_df.columns and processed_df[col].dtype in [np.float64, np.int64]:
-                if method == 'clip':
-                    Q1 = processed_df[col].quantile(0.25)
-                    Q3 = processed_df[col].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    processed_df[col] = processed_df[col].clip(lower_bound, upper_bound)
-                elif method == 'remove':
-                    Q1 = processed_df[col].quantile(0.25)
-                    Q3 = processed_df[col].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    processed_df = processed_df[(processed_df[col] >= lower_bound) & (processed_df[col] <= upper_bound)]
+        outlier_cols = [
+            col for col in config['handle_outliers']
+            if col in numeric_cols
+        ]
+        
+        if outlier_cols and len(processed_df) > 0:
+            # 対象列をまとめて1つの配列にし、IQRしきい値を一括で計算
+            values = processed_df[outlier_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                Q1, Q3 = np.nanpercentile(values, [25, 75], axis=0)
+            IQR = Q3 - Q1
+            lower_bound = Q1 - 1.5 * IQR
+            upper_bound = Q3 + 1.5 * IQR
+            
+            methods = np.array([config['handle_outliers'][col] for col in outlier_cols])
+            
+            clip = methods == 'clip'
+            if clip.any():
+                clip_cols = [col for col, is_clip in zip(outlier_cols, clip) if is_clip]
+                clipped = pd.DataFrame(
+                    np.clip(values[:, clip], lower_bound[clip], upper_bound[clip]),
+                    index=processed_df.index, columns=clip_cols
+                )
+                # 浮動小数点の列は元の型（float32やArrow型）のまま書き戻す
+                float_dtypes = {col: processed_df[col].dtype for col in clip_cols if pd.api.types.is_float_dtype(processed_df[col])}
+                processed_df[clip_cols] = clipped.astype(float_dtypes)
+            
+            remove = methods == 'remove'
+            if remove.any():
+                # しきい値の範囲内にない値（欠損値を含む）がある行を削除
+                within = (values[:, remove] >= lower_bound[remove]) & (values[:, remove] <= upper_bound[remove])
+                processed_df = processed_df[within.all(axis=1)]
                     
     if 'scaling' in config and config['scaling']:
-        numeric_cols = processed_df.select_dtypes(include=[np.number]).columns.tolist()
-        
         scaling_method = config['scaling']['method']
-        columns = config['scaling'].get('columns', numeric_cols)
+        columns = config['scaling'].get('columns', [col for col in processed_df.columns if col in numeric_cols])
         
         valid_cols = [col for col in columns if col in numeric_cols]
         
         if valid_cols:
-            if scaling_method == 'standard':
-                scaler = StandardScaler()
-            elif scaling_method == 'minmax':
-                scaler = MinMaxScaler()
-            elif scaling_method == 'robust':
-                scaler = RobustScaler()
-            else:
+            if scaling_method not in ('standard', 'minmax', 'robust'):
                 return processed_df
             
-            processed_df[valid_cols] = scaler.fit_transform(processed_df[valid_cols])
+            # 全てfloat32の列ならfloat32のまま、それ以外はfloat64で計算する
+            dtype = np.float32 if all(processed_df[col].dtype == np.float32 for col in valid_cols) else np.float64
+            values = processed_df[valid_cols].to_numpy(dtype=dtype, na_value=np.nan, copy=True)
+            _scale_in_place(values, scaling_method)
+            processed_df[valid_cols] = values
             
     if 'feature_engineering' in config and config['feature_engineering']:
         
         for col, features in config['feature_engineering'].items():
             if col in processed_df.columns:
                 
-                if 'datetime_features' in features and pd.api.types.is_datetime64_any_dtype(processed_df[col]):
-                    if 'year' in features['datetime_features']:
-                        processed_df[f'{col}_year'] = processed_df[col].dt.year
-                    
-                    if 'month' in features['datetime_features']:
-                        processed_df[f'{col}_month'] = processed_df[col].dt.month
-                    
-                    if 'day' in features['datetime_features']:
-                        processed_df[f'{col}_day'] = processed_df[col].dt.day
-                    
-                    if 'weekday' in features['datetime_features']:
-                        processed_df[f'{col}_weekday'] = processed_df[col].dt.weekday
-                    
-                    if 'quarter' in features['datetime_features']:
-                        processed_df[f'{col}_quarter'] = processed_df[col].dt.quarter
+                if 'datetime_features' in features and col in datetime_cols:
+                    # 日付の各要素を1回の走査でまとめて求め、要求された特徴量を1回の assign で追加する
+                    calendar = _calendar_fields(processed_df[col])
+                    new_cols = {
+                        f'{col}_{feature}': calendar[feature]
+                        for feature in ['year', 'month', 'day', 'weekday', 'quarter']
+                        if feature in features['datetime_features']
+                    }
                     
                     if 'is_weekend' in features['datetime_features']:
-                        processed_df[f'{col}_is_weekend'] = (processed_df[col].dt.weekday >= 5).astype(int)
-                if 'binning' in features and processed_df[col].dtype in [np.float64, np.int64]:
+                        new_cols[f'{col}_is_weekend'] = (calendar['weekday'] >= 5).astype('int8')
+                    
+                    processed_df = processed_df.assign(**new_cols)
+                if 'binning' in features and col in numeric_cols:
                     n_bins = features['binning'].get('n_bins', 5)
                     labels = features['binning'].get('labels', None)
-                    processed_df[f'{col}_bin'] = pd.cut(
-                        processed_df[col],
-                        bins=n_bins,
-                        labels=labels
-                    )
-                    
-                if 'text_features' in features and pd.api.types.is_string_dtype(processed_df[col]):
-                    if 'length' in features['text-features']:
-                        processed_df[f'{col}_length'] = processed_df[col].str.len()
-                    
-                    if 'word_count' in features['text_features']:
-                        processed_df[f'{col}_word_count'] = processed_df[col].str.split().str.len()
+                    if labels is None:
+                        # ラベル指定がなければビン番号（0始まり）をビン数に収まる最小の整数型で保持する
+                        # （欠損値がある場合は欠損可能な整数型）
+                        n_intervals = n_bins if np.isscalar(n_bins) else len(n_bins) - 1
+                        bin_dtype = np.min_scalar_type(-max(int(n_intervals), 1)).name
+                        bin_codes = pd.cut(processed_df[col], bins=n_bins, labels=False)
+                        processed_df[f'{col}_bin'] = bin_codes.astype(bin_dtype.capitalize() if bin_codes.isna().any() else bin_dtype)
+                    else:
+                        processed_df[f'{col}_bin'] = pd.cut(
+                            processed_df[col],
+                            bins=n_bins,
+                            labels=labels
+                        )
                     
-                    if 'contains' in features['text_features']:
-                        processed_df[new_col] = processed_df[col].str.contains(item, case=False).astype(int)
+                if 'text_features' in features and col in string_cols:
+                    new_cols = _text_features(
+                        processed_df[col], features['text_features'], col,
+                        min_arrow_rows=config.get('backend_threshold_rows', ARROW_TEXT_MIN_ROWS)
+                    )
+                    processed_df = processed_df.assign(**new_cols)
                         
     if 'encoding' in config and config['encoding']:
-        for col, method in config['encoding'].items():
-            if col in processed_df.columns:
-                if method == 'onehot':
-                    
-                    dummies = pd.get_dummies(processed_df[col], prefix=col)
-                    processed_df = pd.concat([processed_df, dummies], axis=1)
-                    processed_df = processed_df.drop(col,axis=1)
-                elif method == 'label':
-                    
-                    processed_dt[col] = processed_df[col.astype('category')].cat.codes
+        onehot_cols = [col for col, method in config['encoding'].items() if method == 'onehot' and col in processed_df.columns]
+        label_cols = [col for col, method in config['encoding'].items() if method == 'label' and col in processed_df.columns]
+        
+        if label_cols:
+            processed_df[label_cols] = processed_df[label_cols].apply(lambda s: s.astype('category').cat.codes)
+        
+        if onehot_cols:
+            # カテゴリ数の多い列はほとんどが0になるため疎な形式で展開する
+            nunique = processed_df[onehot_cols].nunique()
+            sparse_cols = [col for col in onehot_cols if nunique[col] > SPARSE_ONEHOT_MIN_CATEGORIES]
+            dense_cols = [col for col in onehot_cols if col not in sparse_cols]
+            
+            # 同じ形式の列は1回の呼び出しでまとめて展開し、データフレームの再確保を減らす
+            if dense_cols:
+                processed_df = pd.get_dummies(processed_df, columns=dense_cols, prefix=dense_cols, dtype=np.int8)
+            if sparse_cols:
+                processed_df = pd.get_dummies(processed_df, columns=sparse_cols, prefix=sparse_cols, sparse=True, dtype=np.int8)
                     
     if 'drop_columns' in config and config['drop_columns']:
         cols_to_drop = [col for col in config['drop_columns'] if col in processed_df.columns]
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# dashboard/ のモジュールはアプリと同じくトップレベルのモジュールとしてインポートする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'dashboard'))
@@ -0,0 +1,39 @@
+import warnings
+
+import pandas as pd
+
+from advanced_analysis import perform_cluster_analysis, perform_distribution_analysis
+
+
+def test_distribution_of_filtered_category_omits_unused_categories():
+    # 絞り込みで使われなくなったカテゴリは頻度表と棒グラフに含めないこと
+    df = pd.DataFrame({'c': pd.Categorical(['a', 'b', 'c', 'a', 'b'])})
+    filtered = df[df['c'] != 'c']
+    
+    results = perform_distribution_analysis(filtered, 'c')
+    
+    assert results['value_counts'].to_dict() == {'a': 2, 'b': 2}
+    assert results['n_total'] == 4
+    assert list(results['bar_chart'].data[0].x) == ['a', 'b']
+
+
+def test_cluster_stats_skip_clusters_without_rows():
+    # 異なる点が2つしかないデータでは3クラスター目に行が割り当てられないが、エラーにならないこと
+    df = pd.DataFrame({'a': [0.0] * 6 + [10.0] * 6, 'b': [1.0] * 6 + [5.0] * 6})
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = perform_cluster_analysis(df, ['a', 'b'], n_clusters=3)
+    
+    present = sorted(results['df_with_clusters']['cluster'].unique())
+    assert list(results['cluster_stats'].index) == present
+    assert not results['cluster_stats'].isna().any().any()
+
+
+def test_distribution_of_bool_column():
+    # describe() に四分位数がない真偽値の列でもヒストグラムを作成できること
+    df = pd.DataFrame({'flag': [True, False, True, True, False, True]})
+    
+    results = perform_distribution_analysis(df, 'flag')
+    
+    assert 'histogram' in results
@@ -0,0 +1,291 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+import pyarrow as pa
+from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+
+from data_preprocessing import (
+    SPARSE_ONEHOT_MIN_CATEGORIES,
+    _calendar_fields,
+    _scale_in_place,
+    _text_features,
+    preprocess_data,
+)
+
+
+def test_onehot_high_cardinality_table_input():
+    # カテゴリ数がしきい値を超える列は疎な形式で展開されるが、Arrowのテーブルとして返せること
+    n_categories = SPARSE_ONEHOT_MIN_CATEGORIES + 8
+    values = [f'v{i % n_categories}' for i in range(n_categories * 3)]
+    table = pa.table({'z': values, 'x': list(range(len(values)))})
+    
+    result = preprocess_data(table, {'encoding': {'z': 'onehot'}})
+    
+    assert isinstance(result, pa.Table)
+    assert result.num_rows == len(values)
+    dummy_cols = [name for name in result.column_names if name.startswith('z_')]
+    assert len(dummy_cols) == n_categories
+    assert 'z' not in result.column_names
+    
+    df = result.to_pandas()
+    assert (df[dummy_cols].sum(axis=1) == 1).all()
+    assert df['z_v0'].tolist() == [int(v == 'v0') for v in values]
+
+
+def test_onehot_high_cardinality_dataframe_input_stays_sparse():
+    n_categories = SPARSE_ONEHOT_MIN_CATEGORIES + 8
+    df = pd.DataFrame({'z': [f'v{i}' for i in range(n_categories)]})
+    
+    result = preprocess_data(df, {'encoding': {'z': 'onehot'}})
+    
+    assert all(isinstance(dtype, pd.SparseDtype) for dtype in result.dtypes)
+
+
+def test_preprocess_data_emits_no_deprecation_warning():
+    # pandas 3以降で非推奨の Copy-on-Write オプションを参照しないこと
+    df = pd.DataFrame({'x': [1.0, 2.0, 3.0]})
+    
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        result = preprocess_data(df, {})
+    
+    assert result['x'].tolist() == [1.0, 2.0, 3.0]
+
+
+@pytest.mark.parametrize('method, expected', [
+    ('mean', (1 + 2 + 4) / 3),
+    ('median', 2.0),
+])
+def test_table_input_mean_median_fill_is_not_truncated(method, expected):
+    # 欠損値を含む整数列はArrowの整数型になるが、補完値は整数に切り捨てないこと
+    table = pa.table({'x': [1, 2, None, 4]})
+    
+    result = preprocess_data(table, {'handle_missing': {'x': method}})
+    
+    assert result.column('x').to_pylist() == pytest.approx([1.0, 2.0, expected, 4.0])
+
+
+@pytest.mark.parametrize('method, expected', [
+    ('mean', (1 + 2 + 4) / 3),
+    ('median', 2.0),
+])
+def test_pyarrow_backend_keeps_integral_floats_as_float(method, expected):
+    # 整数値だけの浮動小数点列もArrowの浮動小数点型のままにし、補完値を切り捨てないこと
+    df = pd.DataFrame({'x': [1.0, 2.0, np.nan, 4.0], 'n': [1, 2, 3, 4]})
+    
+    result = preprocess_data(df, {'dtype_backend': 'pyarrow', 'handle_missing': {'x': method}})
+    
+    assert result['x'].dtype == pd.ArrowDtype(pa.float64())
+    assert result['n'].dtype == pd.ArrowDtype(pa.int64())
+    assert result['x'].tolist() == pytest.approx([1.0, 2.0, expected, 4.0])
+
+
+def test_string_dtype_check_limited_to_text_feature_columns(monkeypatch):
+    # 文字列判定はテキスト特徴量を作成する列だけに行うこと
+    checked = []
+    is_string_dtype = pd.api.types.is_string_dtype
+    
+    def recording_is_string_dtype(arr_or_dtype):
+        if isinstance(arr_or_dtype, pd.Series):
+            checked.append(arr_or_dtype.name)
+        return is_string_dtype(arr_or_dtype)
+    
+    monkeypatch.setattr(pd.api.types, 'is_string_dtype', recording_is_string_dtype)
+    df = pd.DataFrame({'text': ['a b', 'c'], 'other': ['x', 'y'], 'n': [1, 2]})
+    
+    result = preprocess_data(df, {'feature_engineering': {'text': {'text_features': ['length']}}})
+    
+    assert checked == ['text']
+    assert result['text_length'].tolist() == [3, 1]
+
+
+@pytest.mark.parametrize('threshold', [0, 10**9])
+def test_backend_threshold_rows_selects_text_path(threshold):
+    # しきい値を設定から変更でき、どちらの処理でも同じ結果になること
+    df = pd.DataFrame({'t': ['Hello world', '  spaced   out ', '', 'HELLO']})
+    config = {
+        'backend_threshold_rows': threshold,
+        'feature_engineering': {'t': {'text_features': {'length': True, 'word_count': True, 'contains': ['hello']}}},
+    }
+    
+    result = preprocess_data(df, config)
+    
+    assert result['t_length'].tolist() == [11, 15, 0, 5]
+    assert result['t_word_count'].tolist() == [2, 2, 0, 1]
+    assert result['t_contains_hello'].tolist() == [1, 0, 0, 1]
+    assert result['t_contains_hello'].dtype == np.int8
+
+
+FILL_VALUES = [1, None, 4, 4, None, 9]
+
+
+def _fill_reference(method):
+    # pandas の列ごとの処理による期待値
+    series = pd.Series(FILL_VALUES, dtype='float64')
+    if method == 'drop':
+        return series.dropna()
+    if method == 'mean':
+        return series.fillna(series.mean())
+    if method == 'median':
+        return series.fillna(series.median())
+    if method == 'mode':
+        return series.fillna(series.mode()[0])
+    if method == 'zero':
+        return series.fillna(0)
+    if method == 'forward':
+        return series.ffill()
+    return series.bfill()
+
+
+@pytest.mark.parametrize('method', ['drop', 'mean', 'median', 'mode', 'zero', 'forward', 'backward'])
+@pytest.mark.parametrize('dtype', [
+    'float64',
+    'Int64',
+    pd.ArrowDtype(pa.float64()),
+    pd.ArrowDtype(pa.int64()),
+])
+def test_fill_methods_match_pandas(method, dtype):
+    df = pd.DataFrame({'x': pd.array(FILL_VALUES, dtype=dtype), 'y': range(len(FILL_VALUES))})
+    expected = _fill_reference(method)
+    
+    result = preprocess_data(df, {'handle_missing': {'x': method}})
+    
+    assert result.index.tolist() == expected.index.tolist()
+    assert result['x'].to_numpy(dtype=np.float64, na_value=np.nan) == pytest.approx(expected.to_numpy())
+
+
+def test_fill_methods_grouped_in_one_config():
+    # 方法ごとにまとめて処理しても、列ごとに処理した結果と同じになること
+    methods = ['mean', 'median', 'mode', 'zero', 'forward', 'backward']
+    df = pd.DataFrame({method: pd.Series(FILL_VALUES, dtype='float64') for method in methods})
+    
+    result = preprocess_data(df, {'handle_missing': {method: method for method in methods}})
+    
+    for method in methods:
+        assert result[method].tolist() == pytest.approx(_fill_reference(method).tolist())
+
+
+def test_zero_fill_on_category_column():
+    df = pd.DataFrame({'c': pd.Categorical(['a', None, 'b'])})
+    
+    result = preprocess_data(df, {'handle_missing': {'c': 'zero'}})
+    
+    assert result['c'].tolist() == ['a', 0, 'b']
+
+
+SCALING_VALUES = np.array([
+    [1.0, 5.0, -2.0],
+    [2.0, 5.0, np.nan],
+    [np.nan, 5.0, 7.5],
+    [4.0, 5.0, 3.0],
+    [10.0, 5.0, 0.5],
+])
+
+
+@pytest.mark.parametrize('method, scaler', [
+    ('standard', StandardScaler),
+    ('minmax', MinMaxScaler),
+    ('robust', RobustScaler),
+])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_scale_in_place_matches_sklearn(method, scaler, dtype):
+    values = SCALING_VALUES.astype(dtype)
+    expected = scaler().fit_transform(values)
+    
+    _scale_in_place(values, method)
+    
+    np.testing.assert_allclose(values, expected, rtol=1e-5 if dtype == np.float32 else 1e-12, equal_nan=True)
+
+
+def _assert_calendar_matches_dt(series):
+    calendar = _calendar_fields(series)
+    
+    for field in ['year', 'month', 'day', 'weekday', 'quarter']:
+        expected = getattr(series.dt, field).to_numpy(dtype=np.float64, na_value=np.nan)
+        actual = calendar[field].to_numpy(dtype=np.float64, na_value=np.nan)
+        np.testing.assert_array_equal(actual, expected, err_msg=field)
+
+
+DATETIME_VALUES = [
+    '1969-12-31 23:59:59', '1970-01-01', '2000-02-29 12:00', '2023-12-31 23:30',
+    '2024-03-31', None, '1900-03-01', '2100-12-31 06:00',
+]
+
+
+def test_calendar_fields_match_dt_accessor():
+    _assert_calendar_matches_dt(pd.Series(pd.to_datetime(DATETIME_VALUES, format='ISO8601')))
+
+
+def test_calendar_fields_match_dt_accessor_tz_aware():
+    # 地域の日時で計算すること（UTCでは日付が前日になる時刻を含む）
+    series = pd.Series(pd.to_datetime(DATETIME_VALUES, format='ISO8601')).dt.tz_localize('Asia/Tokyo')
+    _assert_calendar_matches_dt(series)
+
+
+def test_calendar_fields_match_dt_accessor_arrow_timestamp():
+    series = pd.Series(pd.to_datetime(DATETIME_VALUES, format='ISO8601')).astype(pd.ArrowDtype(pa.timestamp('us')))
+    _assert_calendar_matches_dt(series)
+
+
+def test_table_input_datetime_features():
+    # Arrowのtimestamp列も日時列として扱い、特徴量を作成すること
+    table = pa.table({'d': pa.array(pd.to_datetime(['2024-01-06', '2024-04-01', None]), type=pa.timestamp('ns'))})
+    features = {'datetime_features': ['year', 'month', 'quarter', 'is_weekend']}
+    
+    result = preprocess_data(table, {'feature_engineering': {'d': features}}).to_pandas()
+    
+    assert result['d_year'].tolist()[:2] == [2024, 2024]
+    assert result['d_month'].tolist()[:2] == [1, 4]
+    assert result['d_quarter'].tolist()[:2] == [1, 2]
+    assert result['d_is_weekend'].tolist() == [1, 0, 0]
+
+
+@pytest.mark.parametrize('values, n_bins, expected_dtype', [
+    ([0.0, 1.0, 2.0, 3.0], 3, 'int8'),
+    ([0.0, np.nan, 2.0, 3.0], 3, 'Int8'),
+    (list(range(400)), 200, 'int16'),
+    ([0.0, np.nan] + list(range(400)), 200, 'Int16'),
+])
+def test_bin_codes_dtype(values, n_bins, expected_dtype):
+    df = pd.DataFrame({'x': values})
+    
+    result = preprocess_data(df, {'feature_engineering': {'x': {'binning': {'n_bins': n_bins}}}})
+    
+    expected = pd.cut(df['x'], bins=n_bins, labels=False)
+    assert str(result['x_bin'].dtype) == expected_dtype
+    assert result['x_bin'].to_numpy(dtype=np.float64, na_value=np.nan) == pytest.approx(expected.to_numpy(), nan_ok=True)
+
+
+@pytest.mark.parametrize('dtype', [object, 'string', pd.ArrowDtype(pa.string())])
+def test_text_features_pandas_and_arrow_paths_match(dtype):
+    series = pd.Series(
+        ['Hello world', '  spaced   out ', '', None, 'HELLO', 'abc', 'a-c', '日本語 テキスト'],
+        dtype=dtype
+    )
+    text_features = {'length': True, 'word_count': True, 'contains': ['hello', 'a.c']}
+    
+    pandas_result = _text_features(series, text_features, 't', min_arrow_rows=len(series) + 1)
+    arrow_result = _text_features(series, text_features, 't', min_arrow_rows=0)
+    
+    assert pandas_result.keys() == arrow_result.keys()
+    for name in pandas_result:
+        expected = pandas_result[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        actual = arrow_result[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        np.testing.assert_array_equal(actual, expected, err_msg=name)
+        assert arrow_result[name].index.equals(series.index)
+
+
+def test_small_arrow_string_column_text_features():
+    # 行数の少ないArrow型の文字列列でも単語数を求められること
+    df = pd.DataFrame({'t': ['Hello world', '  spaced   out ', '']})
+    config = {
+        'dtype_backend': 'pyarrow',
+        'feature_engineering': {'t': {'text_features': {'length': True, 'word_count': True}}},
+    }
+    
+    result = preprocess_data(df, config)
+    
+    assert result['t_length'].tolist() == [11, 15, 0]
+    assert result['t_word_count'].tolist() == [2, 2, 0]